@@ -0,0 +1,111 @@
+"""Offline benchmark for the points, badges and role-session hot paths.
+
+    python -m bench.hot_paths --members 10000 --challenges 300 --other-roles 250
+
+Runs against synthetic stand-ins from bench.synthetic, no discord connection needed.
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from bench.synthetic import build_guild
+from modules import points, badges, config, role_scheduler
+from modules.role_management import RoleSession
+
+
+def measure(name: str, fn, ops: int = 1, repeat: int = 3) -> dict:
+    """Time fn() (best of repeat) and record peak traced allocations of one run."""
+    fn()  # warm-up
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'name': name, 'ops': ops, 'seconds': best, 'peak_kib': peak / 1024}
+
+
+def report(results: list[dict]) -> None:
+    print(f'{"entry point":<36} {"ops":>7} {"total ms":>10} {"us/op":>10} {"ops/s":>12} {"peak KiB":>10}')
+    for r in results:
+        per_op = r['seconds'] / r['ops']
+        print(
+            f'{r["name"]:<36} {r["ops"]:>7} {r["seconds"] * 1000:>10.2f} '
+            f'{per_op * 1e6:>10.1f} {1 / per_op if per_op else float("inf"):>12.0f} {r["peak_kib"]:>10.1f}'
+        )
+
+
+def run(args) -> list[dict]:
+    # measure the work itself, not the coalescing windows
+    config.timings['role_commit'] = 0
+    config.rate_limits['member_edit'] = (10**9, 1)
+
+    guild = build_guild(args.members, args.challenges, args.other_roles, seed=args.seed)
+    humans = [m for m in guild.members if not m.bot]
+    sample = humans[:args.sample]
+    loop = asyncio.new_event_loop()
+
+    points.build_challenge_registry(guild)
+    points.build_leaderboard_index(guild)
+    ranked = points.get_ranked_leaderboard(guild)
+
+    def cold_sync():
+        points._synced_top_map = None
+        loop.run_until_complete(points.sync_leaderboard_roles(guild, ranked))
+
+    def commits(change: bool):
+        async def _run():
+            for m in sample:
+                async with RoleSession(m) as rs:
+                    if change:
+                        rs.add('birthday') if config.roles['birthday'] not in m.role_ids else rs.remove('birthday')
+        return lambda: loop.run_until_complete(_run())
+
+    results = [
+        measure('build_challenge_registry', lambda: points.build_challenge_registry(guild), repeat=args.repeat),
+        measure('ChallengeMatrix', lambda: points.ChallengeMatrix(guild), repeat=args.repeat),
+        measure('build_leaderboard_index', lambda: points.build_leaderboard_index(guild), repeat=args.repeat),
+        measure('get_leaderboard', lambda: points.get_leaderboard(guild), repeat=args.repeat),
+        measure('get_ranked_leaderboard', lambda: points.get_ranked_leaderboard(guild), repeat=args.repeat),
+        measure('get_member_rank', lambda: [points.get_member_rank(guild, m) for m in sample],
+                ops=len(sample), repeat=args.repeat),
+        measure('refresh_member_points', lambda: [points.refresh_member_points(m) for m in sample],
+                ops=len(sample), repeat=args.repeat),
+        measure('has_all_challenges', lambda: [points.has_all_challenges(m, {'⭐', '☄'}) for m in sample],
+                ops=len(sample), repeat=args.repeat),
+        measure('sync_leaderboard_roles (cold)', cold_sync, repeat=args.repeat),
+        measure('sync_leaderboard_roles (steady)',
+                lambda: loop.run_until_complete(points.sync_leaderboard_roles(guild, ranked)), repeat=args.repeat),
+        measure('get_owned_badge_roles', lambda: [badges.get_owned_badge_roles(m) for m in sample],
+                ops=len(sample), repeat=args.repeat),
+        measure('RoleSession.commit (no-op)', commits(False), ops=len(sample), repeat=args.repeat),
+        measure('RoleSession.commit (toggle)', commits(True), ops=len(sample), repeat=args.repeat),
+    ]
+    loop.run_until_complete(role_scheduler.shutdown())
+    loop.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, default=10_000)
+    parser.add_argument('--challenges', type=int, default=300)
+    parser.add_argument('--other-roles', type=int, default=250)
+    parser.add_argument('--sample', type=int, default=500, help='members used by per-member entry points')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f'synthetic guild: {args.members} members, {args.challenges} challenge roles, '
+          f'{args.other_roles} other roles')
+    report(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Stand-ins for discord guilds, roles and members, shaped like the real server.
+
+Only the attributes the bot's hot paths touch are implemented.
+"""
+import random
+
+from modules import config
+
+TIERS = ('🟢', '⭐', '☄')
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str, position: int):
+        self.id = role_id
+        self.name = name
+        self.position = position
+        self.guild = None
+
+    def is_default(self) -> bool:
+        return self.position == 0
+
+    @property
+    def mention(self) -> str:
+        return f'<@&{self.id}>'
+
+    @property
+    def members(self) -> list:
+        return [m for m in self.guild.members if self.id in m.role_ids]
+
+    def __hash__(self):
+        return self.id
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+
+class FakeMember:
+    def __init__(self, guild, member_id: int, role_ids: set[int], bot: bool = False):
+        self.guild = guild
+        self.id = member_id
+        self.role_ids = role_ids
+        self.bot = bot
+        self.display_name = f'member{member_id}'
+        self.mention = f'<@{member_id}>'
+        self.voice = None
+        self.joined_at = None
+        self.edits = 0
+
+    @property
+    def roles(self) -> list:
+        # discord.py builds this list on every access too
+        return sorted((self.guild.get_role(r) for r in self.role_ids | {self.guild.id}), key=lambda r: r.position)
+
+    async def edit(self, *, roles):
+        self.role_ids = {r.id for r in roles} - {self.guild.id}
+        self.edits += 1
+
+    def __hash__(self):
+        return self.id
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int = config.TARGET_GUILD):
+        self.id = guild_id
+        self._roles: dict[int, FakeRole] = {}
+        self._members: dict[int, FakeMember] = {}
+        self.emojis = []
+
+    @property
+    def roles(self) -> list:
+        return sorted(self._roles.values(), key=lambda r: r.position)
+
+    @property
+    def members(self) -> list:
+        return list(self._members.values())
+
+    def get_role(self, role_id: int):
+        return self._roles.get(role_id)
+
+    def get_member(self, member_id: int):
+        return self._members.get(member_id)
+
+    def add_role(self, role: FakeRole) -> FakeRole:
+        role.guild = self
+        self._roles[role.id] = role
+        return role
+
+    def add_member(self, member: FakeMember) -> FakeMember:
+        self._members[member.id] = member
+        return member
+
+
+def _configured_role_ids() -> list[int]:
+    ids = []
+    for value in config.roles.values():
+        ids.extend(value if isinstance(value, list) else [value])
+    return list(dict.fromkeys(ids))
+
+
+def build_guild(members: int = 10_000, challenges: int = 300, other_roles: int = 250,
+                challenges_per_member: int = 12, seed: int = 0) -> FakeGuild:
+    """Build a guild with the given scale.
+
+    Roles are laid out like the real server: category roles ("──╱ ... ─") each
+    followed by their sub roles and a "🚫 none" role, challenge roles carrying
+    the 🏆/💠 naming scheme, and a 👁 badge role per challenge.
+    """
+    rng = random.Random(seed)
+    guild = FakeGuild()
+    next_id = iter(range(10**17, 10**18))
+
+    layout: list[tuple[int | None, str]] = [(guild.id, '@everyone')]
+
+    configured = _configured_role_ids()
+    layout.append((None, '──╱ config ╱──────────'))
+    layout.extend((role_id, f'configured {role_id}') for role_id in configured)
+
+    layout.append((None, '──╱ challenges ╱──────────'))
+    challenge_names = []
+    for i in range(challenges):
+        name = f'challenge {i}'
+        challenge_names.append(name)
+        prefix = '💠' if i % 10 == 0 else '🏆'
+        layout.append((None, f'{prefix}{TIERS[i % 3]} {name} /+{rng.randint(1, 30)}/'))
+
+    layout.append((None, '──╱ badges ╱──────────'))
+    layout.extend((None, f'👁 {name}') for name in challenge_names)
+    layout.append((None, '🚫 none'))
+
+    categories = max(1, other_roles // 25)
+    for c in range(categories):
+        layout.append((None, f'──╱ misc {c} ╱──────────'))
+        layout.extend((None, f'misc {c}.{i}') for i in range(other_roles // categories))
+        layout.append((None, '🚫 none'))
+
+    # discord positions: @everyone is 0, the first role listed ends up on top
+    total = len(layout)
+    for index, (role_id, name) in enumerate(layout):
+        position = 0 if index == 0 else total - index
+        guild.add_role(FakeRole(role_id or next(next_id), name, position))
+
+    challenge_ids = [r.id for r in guild.roles if r.name[:1] in ('🏆', '💠')]
+    misc_ids = [r.id for r in guild.roles if r.name.startswith('misc ')]
+    base_roles = {config.roles['person'], config.roles['not_available']}
+
+    for _ in range(members):
+        owned = set(rng.sample(challenge_ids, min(len(challenge_ids), rng.randint(0, challenges_per_member * 2))))
+        owned |= set(rng.sample(misc_ids, min(len(misc_ids), rng.randint(0, 5))))
+        guild.add_member(FakeMember(guild, next(next_id), owned | base_roles))
+
+    guild.add_member(FakeMember(guild, next(next_id), {config.roles['bot']}, bot=True))
+    return guild
@@ -2,12 +2,15 @@ import asyncio
 
 import discord
 from discord.ext import commands, tasks
-from modules import config, activity, moderation, general, badges
+from modules import config, activity, moderation, general, badges, points_history, reconcile, debounce
 from modules.config import TARGET_GUILD
 from modules.general import timed_delete_msg, send_timed_delete_msg
-from modules.role_management import RoleSession
+from modules.role_management import RoleSession, invalidate_role_hierarchy
+from modules.role_scheduler import NORMAL
 from modules.saves import create_save, disband_save, rename_save
-from modules.points import calculate_points, get_ranked_leaderboard, update_leaderboard_message, parse_challenge_role, get_member_rank, has_all_challenges, LB_EMOJI
+from modules.points import calculate_points, get_ranked_leaderboard, schedule_leaderboard_update, parse_challenge_role, get_member_rank, has_all_challenges, LB_EMOJI, \
+    build_leaderboard_index, refresh_member_points, drop_member_points, build_challenge_registry, register_role, unregister_role, \
+    note_display_roles, ALL_DISPLAY_ROLES
 from modules.bot_init import bot
 
 
@@ -27,8 +30,10 @@ f"""
 
 @tasks.loop(minutes=45)
 async def member_checker():
+    if not activity.history_complete():
+        await activity.build_activity_cache()  # carry on where the last scan ran out of time
     await activity.check_all_members()
-    await activity.run_activity_checks()
+    activity.compact_activity_cache()
 
 
 @member_checker.error
@@ -38,8 +43,20 @@ async def member_checker_error(error: Exception):
     await general.send(f'-# :warning: member_checker crashed :/ ```{error}```\n\n-# restarted it, but if you need to restart it manually use .force_check_all (available to mods too btw)', 'mod_chat')
     # the loop will automatically restart on next interval since we don't re-raise
 
+@bot.event
+async def on_disconnect():
+    # a resumed session replays what we missed, a fresh one doesn't - let a scan confirm either way
+    activity.mark_history_incomplete()
+
+
+@bot.event
+async def on_resumed():
+    await activity.build_activity_cache()  # just the gap since the checkpoint
+
+
 @bot.event
 async def on_ready():
+    activity.mark_history_incomplete()  # first thing, chat during the awaits below must not move the checkpoint
     await general.send(f':radio_button: bot connected... {version}')
     await general.set_status('starting up...', status=discord.Status.idle) # type: ignore
     await bot.wait_until_ready()
@@ -48,11 +65,23 @@ async def on_ready():
     bot.add_view(badges.WardrobeOpenView())
     await badges.ensure_wardrobe_message(bot)
     await activity.sync_interested_reactions()
+    build_challenge_registry(bot.get_guild(TARGET_GUILD))
+    build_leaderboard_index(bot.get_guild(TARGET_GUILD))
+    snapshot_points_history(bot.get_guild(TARGET_GUILD))
     msg = await general.send(f'-# :eye: building up activity cache', 'mod_chat')
-    await activity.build_activity_cache()
-    await msg.reply('-# :white_check_mark: done')
+
+    async def progress(scanned: int):
+        await msg.edit(content=f'-# :eye: building up activity cache ({scanned} messages scanned)')
+
+    if await activity.build_activity_cache(progress):
+        await msg.reply('-# :white_check_mark: done')
+    else:
+        await msg.reply('-# :hourglass: ran out of time, the rest gets picked up by the next member check')
+    activity.start_expiry_scheduler(bot.get_guild(TARGET_GUILD))
     if not member_checker.is_running():
         member_checker.start()
+    if not general.presence_updater.is_running():
+        general.presence_updater.start()
 
 
 
@@ -80,6 +109,22 @@ async def force_check_all(ctx):
     member_checker.start()
     await ctx.message.add_reaction("✅")
 
+@bot.command(name='reconcile')
+@general.try_bot_perms
+@general.has_perms('manage_roles')
+async def reconcile_roles(ctx, mode: str = None):
+    dry_run = mode == 'dry'
+    plan = await reconcile.reconcile(ctx.guild, dry_run=dry_run)
+    if not plan:
+        return await ctx.send('everyone\'s roles are already right :white_check_mark:')
+
+    lines = reconcile.format_plan(ctx.guild, plan)
+    shown = '\n'.join(lines[:15])
+    if len(lines) > 15:
+        shown += f'\n... and {len(lines) - 15} more'
+    header = f'would fix {len(plan)} members (dry run)' if dry_run else f'fixed {len(plan)} members :white_check_mark:'
+    return await ctx.send(f'{header}\n```{shown[:1800]}```', allowed_mentions=discord.AllowedMentions.none())
+
 @bot.command()
 @general.try_bot_perms
 @general.has_perms('manage_roles')
@@ -152,7 +197,7 @@ async def on_voice_state_update(member, before, after):
 
     messages = []
 
-    async with RoleSession(member) as rs:
+    async with RoleSession(member, priority=NORMAL) as rs:
         # leaving
         if before.channel in channel_info and before.channel != after.channel:
             info = channel_info[before.channel]
@@ -191,7 +236,7 @@ async def on_voice_state_update(member, before, after):
             allowed_mentions=discord.AllowedMentions.none(),
         )
 
-    await general.update_status(bot)
+    general.mark_status_dirty()
 
 
 # Reaction Roles - easy hot-swap
@@ -202,100 +247,78 @@ REACTION_ROLES = {
 }
 
 
-@bot.event
-async def on_raw_reaction_add(payload):
-    if payload.user_id == bot.user.id: return
-    activity.update_cache(payload.user_id)
-    guild = bot.get_guild(payload.guild_id)
-    member = guild.get_member(payload.user_id)
-    if not member or member.bot: return
+async def _availability_reaction(payload, member: discord.Member, added: bool):
+    if payload.emoji.id != config.channels['availability_reaction']:
+        return
+    debounce.toggle('availability', member.id, member.guild, 'available', added,
+                    general.has_role(member, config.roles['available']))
+
+
+async def _interested_reaction(payload, member: discord.Member, added: bool):
+    # tiered interested roles
+    role_map = activity.get_interested_role_map(member.guild, payload.message_id)
+    role = role_map.get(str(payload.emoji))
+    if role is None:
+        return
+    debounce.toggle('interested', member.id, member.guild, role, added, role in member.roles)
+
 
+async def _static_reaction_role(payload, member: discord.Member, added: bool):
+    role_id = REACTION_ROLES[payload.message_id].get(str(payload.emoji))
+    if role_id is None:
+        return
+    debounce.toggle('reaction_roles', member.id, member.guild, role_id, added,
+                    general.has_role(member, role_id))
+
+
+async def _flush_reaction_roles(user_id: int, guild: discord.Guild, added: set, removed: set):
+    member = guild.get_member(user_id)
+    if not member:
+        return
     async with RoleSession(member) as rs:
-        # availability logic
-        if payload.message_id == config.channels['availability_message']:
-            if payload.emoji.id == config.channels['availability_reaction']:
-                await activity.add_availability(rs, member)
-
-        # interested roles logic (tiered) - don't commit immediately
-        interested_msgs = [
-            activity.INTERESTED_MESSAGE_BASE,
-            activity.INTERESTED_MESSAGE_STAR,
-            activity.INTERESTED_MESSAGE_ULTIMATE
-        ]
-        if payload.message_id in interested_msgs:
-            role_map = activity.get_interested_role_map(guild, payload.message_id)
-            emoji_str = str(payload.emoji)
-            if emoji_str in role_map:
-                role = role_map[emoji_str]
-
-                # track initial state if first change
-                if payload.user_id not in activity.user_initial_states:
-                    activity.user_initial_states[payload.user_id] = {
-                        r for r in role_map.values() if r in member.roles
-                    }
-
-                # update debounce state
-                state = activity.user_pending_changes.setdefault(
-                    payload.user_id, {'added': set(), 'removed': set()}
-                )
-                state['added'].add(role)
-                state['removed'].discard(role)
-                await activity.schedule_interested_debounce(payload.user_id, guild)
-                return  # don't commit yet
-
-        # static reaction roles
-        if payload.message_id in REACTION_ROLES:
-            emoji_str = str(payload.emoji)
-            if emoji_str in REACTION_ROLES[payload.message_id]:
-                rs.add(REACTION_ROLES[payload.message_id][emoji_str])
+        for role_id in added:
+            rs.add(role_id)
+        for role_id in removed:
+            rs.remove(role_id)
 
 
-@bot.event
-async def on_raw_reaction_remove(payload):
+debounce.register('reaction_roles', _flush_reaction_roles, 'reaction_roles')
+
+
+# message id -> handler; anything not in here is dropped before we touch the member
+REACTION_HANDLERS = {
+    config.channels['availability_message']: _availability_reaction,
+    activity.INTERESTED_MESSAGE_BASE: _interested_reaction,
+    activity.INTERESTED_MESSAGE_STAR: _interested_reaction,
+    activity.INTERESTED_MESSAGE_ULTIMATE: _interested_reaction,
+    **{message_id: _static_reaction_role for message_id in REACTION_ROLES},
+}
+
+
+async def route_reaction(payload, added: bool):
+    if payload.message_id == config.channels['availability_message'] and \
+            payload.emoji.id == config.channels['availability_reaction']:
+        general.note_availability_reaction(payload.user_id, added)
     if payload.user_id == bot.user.id: return
     activity.update_cache(payload.user_id)
+
+    handler = REACTION_HANDLERS.get(payload.message_id)
+    if handler is None:
+        return
     guild = bot.get_guild(payload.guild_id)
     member = guild.get_member(payload.user_id)
     if not member or member.bot: return
+    await handler(payload, member, added)
 
-    async with RoleSession(member) as rs:
-        # availability logic
-        if payload.message_id == config.channels['availability_message']:
-            if payload.emoji.id == config.channels['availability_reaction']:
-                await activity.remove_availability(rs, member)
-
-        # interested roles logic (tiered) - don't commit immediately
-        interested_msgs = [
-            activity.INTERESTED_MESSAGE_BASE,
-            activity.INTERESTED_MESSAGE_STAR,
-            activity.INTERESTED_MESSAGE_ULTIMATE
-        ]
-        if payload.message_id in interested_msgs:
-            role_map = activity.get_interested_role_map(guild, payload.message_id)
-            emoji_str = str(payload.emoji)
-            if emoji_str in role_map:
-                role = role_map[emoji_str]
-
-                # track initial state if first change
-                if payload.user_id not in activity.user_initial_states:
-                    activity.user_initial_states[payload.user_id] = {
-                        r for r in role_map.values() if r in member.roles
-                    }
-
-                # update debounce state
-                state = activity.user_pending_changes.setdefault(
-                    payload.user_id, {'added': set(), 'removed': set()}
-                )
-                state['removed'].add(role)
-                state['added'].discard(role)
-                await activity.schedule_interested_debounce(payload.user_id, guild)
-                return  # don't commit yet
-
-        # static reaction roles
-        if payload.message_id in REACTION_ROLES:
-            emoji_str = str(payload.emoji)
-            if emoji_str in REACTION_ROLES[payload.message_id]:
-                rs.remove(REACTION_ROLES[payload.message_id][emoji_str])
+
+@bot.event
+async def on_raw_reaction_add(payload):
+    await route_reaction(payload, True)
+
+
+@bot.event
+async def on_raw_reaction_remove(payload):
+    await route_reaction(payload, False)
 
 async def remove_availability_auto(member):
     channel = bot.get_channel(config.channels['availability'])
@@ -321,7 +344,7 @@ async def remove_availability_auto(member):
 @bot.event
 async def on_member_update(before, after):
     if before.roles != after.roles:
-        async with RoleSession(after) as rs:
+        async with RoleSession(after, priority=NORMAL) as rs:
             before_roles = set(before.roles)
             after_roles = set(after.roles)
             added_roles = after_roles - before_roles
@@ -329,8 +352,18 @@ async def on_member_update(before, after):
 
             # track old rank before any leaderboard update
             old_rank = get_member_rank(after.guild, before)
+            refresh_member_points(after)
             challenge_changed = False
 
+            if any(r.id in ALL_DISPLAY_ROLES for r in added_roles | removed_roles):
+                note_display_roles(after)
+            if any(r.id == general.ALTS_ROLE_ID for r in added_roles | removed_roles):
+                general.note_member(after)
+            # may have just become eligible again with a deadline that already passed
+            if any(r.id in (config.roles['inactive'], config.roles['explained_inactive']) for r in removed_roles) or \
+                    any(r.id == config.roles['available'] for r in added_roles):
+                activity.schedule_expiry(after.id)
+
             log_thread = after.guild.get_thread(1457200972215484417)
 
             for role in added_roles:
@@ -347,6 +380,7 @@ async def on_member_update(before, after):
 
                     new_rank = get_member_rank(after.guild, after)
                     current_pts = calculate_points(after)[0]
+                    points_history.record(after.id, role.id, role_info['points'], current_pts, new_rank)
                     log_msg = (
                         f"{emoji} {after.mention} got **{role_info['name']}** [`"
                         f"+{role_info['points']} pts`] - `{current_pts} pts` total; #{new_rank} on leaderboard"
@@ -367,6 +401,7 @@ async def on_member_update(before, after):
 
                     new_rank = get_member_rank(after.guild, after)
                     current_pts = calculate_points(after)[0]
+                    points_history.record(after.id, role.id, -role_info['points'], current_pts, new_rank)
                     log_msg = (
                         f"<:no:1454950318042255410> {after.mention}'s completion of **{role_info['name']}** was revoked [`"
                         f"-{role_info['points']} pts`] - `{current_pts} pts` total; #{new_rank} on leaderboard"
@@ -376,7 +411,7 @@ async def on_member_update(before, after):
 
             # update leaderboard and check for rank changes
             if challenge_changed:
-                await update_leaderboard_message(bot, after.guild)
+                schedule_leaderboard_update(bot, after.guild)
                 new_rank = get_member_rank(after.guild, after)
 
                 if old_rank != new_rank and new_rank is not None:
@@ -385,24 +420,25 @@ async def on_member_update(before, after):
                         f"{emoji} {after.mention}'s leaderboard position is now **#{new_rank}**!"
                     )
 
-            # check completion roles
-            had_all_base = after.guild.get_role(config.roles["completion_all_base"]) in after_roles
-            has_all_base = has_all_challenges(after, {"🟢"})
+            # check completion roles (only a challenge role change can affect them)
+            if challenge_changed:
+                had_all_base = after.guild.get_role(config.roles["completion_all_base"]) in after_roles
+                has_all_base = has_all_challenges(after, {"🟢"})
 
-            if has_all_base and not had_all_base:
-                rs.add(config.roles["completion_all_base"])
-                await general.send(
-                    f"{config.emoji['star_completion']} {after.mention} beat **all base challenges**!"
-                )
+                if has_all_base and not had_all_base:
+                    rs.add(config.roles["completion_all_base"])
+                    await general.send(
+                        f"{config.emoji['star_completion']} {after.mention} beat **all base challenges**!"
+                    )
 
-            had_all_ultimate = after.guild.get_role(config.roles["completion_all_ultimate"]) in after_roles
-            has_all_ultimate = has_all_challenges(after, {"⭐", "☄"})
+                had_all_ultimate = after.guild.get_role(config.roles["completion_all_ultimate"]) in after_roles
+                has_all_ultimate = has_all_challenges(after, {"⭐", "☄"})
 
-            if has_all_ultimate and not had_all_ultimate:
-                rs.add(config.roles["completion_all_ultimate"])
-                await general.send(
-                    f"{config.emoji['star_pure_completion']} {after.mention} beat **all ultimate challenges**!"
-                )
+                if has_all_ultimate and not had_all_ultimate:
+                    rs.add(config.roles["completion_all_ultimate"])
+                    await general.send(
+                        f"{config.emoji['star_pure_completion']} {after.mention} beat **all ultimate challenges**!"
+                    )
 
             for role in added_roles:
                 if role.id == config.roles['mod']:
@@ -461,13 +497,63 @@ async def on_member_update(before, after):
         await general.send(f':information_source:{config.message('name_change', mention=after.mention, old_name=old, new_name=new)}', 'mod_chat')
 
 
+def snapshot_points_history(guild: discord.Guild):
+    # totals can move without a grant/revoke event (re-weights, deletions, offline changes)
+    points_history.snapshot(
+        (m.id, points, rank) for rank, points, members in get_ranked_leaderboard(guild) for m in members
+    )
+
+
+@bot.event
+async def on_guild_role_create(role: discord.Role):
+    if not config.check_guild(role.guild.id):
+        return
+    invalidate_role_hierarchy(role.guild)
+    activity.invalidate_interested_role_maps()
+    register_role(role)
+
+
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    if not config.check_guild(after.guild.id):
+        return
+    if before.name != after.name or before.position != after.position:
+        invalidate_role_hierarchy(after.guild)
+    if before.name != after.name:
+        activity.invalidate_interested_role_maps()
+    if register_role(after):
+        # challenge renamed or re-weighted, every holder's points may have moved
+        build_leaderboard_index(after.guild)
+        snapshot_points_history(after.guild)
+        schedule_leaderboard_update(bot, after.guild)
+
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    if not config.check_guild(role.guild.id):
+        return
+    invalidate_role_hierarchy(role.guild)
+    activity.invalidate_interested_role_maps()
+    if unregister_role(role.id):
+        build_leaderboard_index(role.guild)
+        snapshot_points_history(role.guild)
+        schedule_leaderboard_update(bot, role.guild)
+
+
+@bot.event
+async def on_guild_emojis_update(guild: discord.Guild, before, after):
+    if not config.check_guild(guild.id):
+        return
+    activity.invalidate_interested_role_maps()
+
+
 @bot.event
 async def on_member_join(member: discord.Member):
     guild = member.guild
     if not config.check_guild(guild.id):
         return
 
-    async with RoleSession(member) as rs:
+    async with RoleSession(member, priority=NORMAL) as rs:
         if member.bot:
             await general.send(config.message('join_bot', mention=member.mention))
             rs.add('bot')
@@ -485,6 +571,8 @@ async def on_member_join(member: discord.Member):
             for role in config.roles['new_people']:
                 rs.add(role)
 
+    refresh_member_points(member)
+    general.note_member(member)
     activity.update_cache(member.id)
 
 
@@ -495,6 +583,9 @@ async def on_member_remove(member: discord.Member):
     if not config.check_guild(guild.id):
         return
 
+    drop_member_points(guild, member.id)
+    general.forget_member(member.id)
+
     if member.bot:
         await general.send(config.message('kick_bot', mention=member.mention))
 
@@ -561,6 +652,8 @@ async def on_message(message: discord.Message):
 
     if message.guild.id == TARGET_GUILD:
         activity.update_cache(message.author.id)
+        if message.channel.id == config.channels['chat']:
+            activity.note_chat_message(message)
 
         if message.content.lower() == 'ps':     # '<#1426974154556702720>' in message.content or
             await message.channel.send(
@@ -783,6 +876,20 @@ async def stats(ctx, member: discord.Member = None):
     await stat_checker(ctx, member)
 
 
+@bot.command()
+@general.try_bot_perms
+async def movers(ctx, days: int = 7):
+    since = discord.utils.utcnow().timestamp() - days * 24 * 60 * 60
+    rows = points_history.top_movers(since)
+    if not rows:
+        return await ctx.send(f'no point changes in the last {days} days')
+
+    lines = [f'# top movers - last {days} days']
+    for i, (member_id, gained) in enumerate(rows, 1):
+        lines.append(f'{i}. <@{member_id}> `{gained:+} pts`')
+    return await ctx.send('\n'.join(lines), allowed_mentions=discord.AllowedMentions.none())
+
+
 @bot.command()
 @general.try_bot_perms
 async def save(ctx, *args):
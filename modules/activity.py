@@ -1,13 +1,18 @@
 import asyncio
+import heapq
+import json
+import os
 import re
+import time
 import datetime
 
 import discord
 from discord import AllowedMentions
 
-from modules import config, general
+from modules import config, general, debounce
 from modules.general import has_role, send, count_available, count_in_vc, emojify
 from modules.role_management import RoleSession
+from modules.role_scheduler import BULK
 from modules.bot_init import bot
 
 async def voice_check(rs: RoleSession, member: discord.Member) -> None:
@@ -80,14 +85,9 @@ async def add_availability(rs: RoleSession, member: discord.Member) -> None:
     rs.add('available')
     rs.remove('not_available')
 
-    msg = await member.guild.get_channel(
-        config.channels['availability']
-    ).fetch_message(config.channels['availability_message'])
-
-    await msg.remove_reaction(
-        discord.PartialEmoji(id=config.channels['availability_reaction'], name='available'),
-        member.guild.me,
-    )
+    reactors = general.availability_reactors
+    if reactors is None or member.guild.me.id in reactors:
+        await general.remove_availability_reaction(member.guild, member.guild.me)
 
 
 async def remove_availability(rs: RoleSession, member: discord.Member) -> None:
@@ -110,37 +110,40 @@ async def remove_availability(rs: RoleSession, member: discord.Member) -> None:
     rs.remove('available')
     rs.add('not_available')
 
-    if available_people == 0:
-        msg = await member.guild.get_channel(
-            config.channels['availability']
-        ).fetch_message(config.channels['availability_message'])
+    reactors = general.availability_reactors
+    if available_people == 0 and (reactors is None or guild.me.id not in reactors):
+        await general.add_availability_reaction(guild)
 
-        await msg.add_reaction(
-            discord.PartialEmoji(id=config.channels['availability_reaction'], name='available')
-        )
+
+async def _flush_availability(user_id: int, guild: discord.Guild, added: set, removed: set) -> None:
+    member = guild.get_member(user_id)
+    if not member:
+        return
+    async with RoleSession(member) as rs:
+        if added:
+            await add_availability(rs, member)
+        else:
+            await remove_availability(rs, member)
 
 
-async def availability_check(rs: RoleSession, member: discord.Member) -> None:
-    channel = member.guild.get_channel(config.channels['availability'])
-    try:
-        msg = await channel.fetch_message(config.channels['availability_message'])
-    except (discord.NotFound, discord.Forbidden):
+debounce.register('availability', _flush_availability, 'reaction_availability')
+
+
+async def availability_check(rs: RoleSession, member: discord.Member, reactors: set[int] | None = None) -> None:
+    if reactors is None:
+        reactors = await general.get_availability_reactors(member.guild)
+    if reactors is None:
         return
 
-    found_reaction = None
-    for reaction in msg.reactions:
-        if reaction.emoji.id == config.channels['availability_reaction']:
-            found_reaction = reaction
-            break
-
-    if found_reaction:
-        async for user in found_reaction.users():
-            if user == member:
-                await add_availability(rs, member)
-                return
+    if member.id in reactors:
+        await add_availability(rs, member)
+    else:
         await remove_availability(rs, member)
 
 
+NEWBIE_DAYS = 7
+
+
 def check_member_join_date(member: discord.Member) -> int | None:
     if member.guild.get_role(config.roles['newbie']) not in member.roles:
         return None
@@ -150,28 +153,45 @@ def check_member_join_date(member: discord.Member) -> int | None:
     return (now - member.joined_at).days
 
 
-async def full_check_member(rs: RoleSession, member: discord.Member) -> None:
-    await availability_check(rs, member)
+async def full_check_member(rs: RoleSession, member: discord.Member, reactors: set[int] | None = None) -> None:
+    await availability_check(rs, member, reactors)
     await voice_check(rs, member)
     days = check_member_join_date(member)
-    if days is not None and days > 7:
+    if days is not None and days > NEWBIE_DAYS:
         rs.remove('newbie')
 
 
 async def check_all_members() -> None:
     server = bot.get_guild(config.TARGET_GUILD)
     await server.chunk()
-    members = server.members
+    members = [m for m in server.members if not m.bot]
     total = len(members)
-
-    for i, member in enumerate(members, 1):
-        if not member.bot:
-            async with RoleSession(member) as rs:
-                await full_check_member(rs, member)
-        print(f'checking members - {round(i * 100 / total, 1)}%')
+    # one read of the reactions for the whole sweep (also resyncs the live set)
+    reactors = await general.load_availability_reactors(server)
+    general.recount_members(server)
+
+    # members are checked concurrently; the role scheduler paces the actual edits
+    semaphore = asyncio.Semaphore(config.SWEEP_CONCURRENCY)
+    done = 0
+
+    async def check(member: discord.Member) -> None:
+        nonlocal done
+        async with semaphore:
+            async with RoleSession(member, priority=BULK) as rs:
+                await full_check_member(rs, member, reactors)
+        done += 1
+        if done == total or done * 10 // total != (done - 1) * 10 // total:
+            print(f'checking members - {round(done * 100 / total)}%')
+
+    results = await asyncio.gather(*(check(m) for m in members), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, Exception)]
 
     await general.update_status(status=discord.Status.online)  # type: ignore
 
+    if errors:
+        print(f'member check failed for {len(errors)} members')
+        raise errors[0]
+
 
 async def check_inactivity() -> None:
     """Standalone inactivity check used by the .check_inactive_people command."""
@@ -188,94 +208,351 @@ bot_inactive_pending: set[int] = set()
 bot_unavailable_pending: set[int] = set()
 user_unavailable_pending: set[int] = set()
 
+# the cache survives restarts as a snapshot plus an append-only log of updates since it.
+# log lines are "<member id> <ts>", or "@ <message id>" for the newest chat message seen
+_CACHE_SNAPSHOT = os.path.join(config.DATA_DIR, 'activity_cache.json')
+_CACHE_LOG = os.path.join(config.DATA_DIR, 'activity_cache.log')
+_cache_log = None
+_cache_loaded = False  # live updates can land before the first load, so emptiness doesn't tell
+
+last_chat_message_id = 0  # newest chat message already folded into the cache
+# set once a history scan has covered everything up to now. until then (startup, reconnects,
+# scans that ran out of time) live messages must not move the checkpoint past unscanned history
+_history_complete = asyncio.Event()
+_history_scan_lock = asyncio.Lock()
+# (newest id, oldest id read so far) of a cold scan that ran out of time
+_cold_scan: tuple[int, int] | None = None
+
+
+def mark_history_incomplete() -> None:
+    """Call when we may have missed chat (connecting/reconnecting), before anything else runs."""
+    _history_complete.clear()
+
+
+def history_complete() -> bool:
+    return _history_complete.is_set()
+
+
+def _log_line(line: str) -> None:
+    global _cache_log
+    if _cache_log is None:
+        os.makedirs(config.DATA_DIR, exist_ok=True)
+        _cache_log = open(_CACHE_LOG, 'a', encoding='utf-8', buffering=1)  # line buffered
+    _cache_log.write(line + '\n')
+
 
 def update_cache(member_id: int, ts: float = None) -> None:
-    last_activity_cache[member_id] = ts or discord.utils.utcnow().timestamp()
+    ts = ts or discord.utils.utcnow().timestamp()
+    last_activity_cache[member_id] = ts
+    _log_line(f'{member_id} {ts}')
+    schedule_expiry(member_id)
 
 
-async def build_activity_cache() -> None:
-    """Runs once on startup to seed the cache and prevent false positives."""
-    guild = bot.get_guild(config.TARGET_GUILD)
+def note_chat_message(message: discord.Message) -> None:
+    """Move the history checkpoint forward; called for every chat message we process live."""
+    global last_chat_message_id
+    if not _history_complete.is_set():
+        return  # the scan owns the checkpoint until it's caught up, or it could skip past a gap
+    if message.id > last_chat_message_id:
+        last_chat_message_id = message.id
+        _log_line(f'@ {message.id}')
+
+
+def _merge_activity(member_id: int, ts: float) -> None:
+    if ts > last_activity_cache.get(member_id, 0):
+        last_activity_cache[member_id] = ts
+
+
+def load_activity_cache() -> bool:
+    """Merge snapshot + log from disk into the cache, keeping any newer live timestamps.
+
+    Returns False if there was nothing to load.
+    """
+    global last_chat_message_id, _cache_loaded
+    _cache_loaded = True
+    try:
+        with open(_CACHE_SNAPSHOT, encoding='utf-8') as f:
+            snapshot = json.load(f)
+        last_chat_message_id = max(last_chat_message_id, snapshot['last_message_id'])
+        for k, v in snapshot['members'].items():
+            _merge_activity(int(k), v)
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    try:
+        with open(_CACHE_LOG, encoding='utf-8') as f:
+            for line in f:
+                key, _, value = line.strip().partition(' ')
+                try:
+                    if key == '@':
+                        last_chat_message_id = max(last_chat_message_id, int(value))
+                    else:
+                        _merge_activity(int(key), float(value))
+                except ValueError:
+                    continue  # torn last line from a crash
+    except FileNotFoundError:
+        pass
+
+    return bool(last_activity_cache)
+
+
+def compact_activity_cache() -> None:
+    """Fold the log into a fresh snapshot and start an empty log."""
+    global _cache_log
+    if not _cache_loaded:
+        load_activity_cache()  # never overwrite what's on disk with a cache that hasn't seen it
+    os.makedirs(config.DATA_DIR, exist_ok=True)
+    tmp = f'{_CACHE_SNAPSHOT}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'last_message_id': last_chat_message_id, 'members': last_activity_cache}, f)
+    os.replace(tmp, _CACHE_SNAPSHOT)
+
+    if _cache_log is not None:
+        _cache_log.close()
+    _cache_log = open(_CACHE_LOG, 'w', encoding='utf-8', buffering=1)
+
+
+def _fold_history_message(msg: discord.Message) -> None:
+    ts = msg.created_at.timestamp()
+
+    if not msg.author.bot:
+        if ts > last_activity_cache.get(msg.author.id, 0):
+            update_cache(msg.author.id, ts)
+    elif msg.author == bot.user:
+        if '<:join:1436503008924926052>' in msg.content:
+            for user_id in (int(x) for x in re.findall(r'\d{17,19}', msg.content)):
+                if ts > last_activity_cache.get(user_id, 0):
+                    update_cache(user_id, ts)
+
+
+def _save_checkpoint() -> None:
+    _log_line(f'@ {last_chat_message_id}')
+
+
+async def build_activity_cache(progress=None) -> bool:
+    """Seed the cache and prevent false positives. Runs on startup and on every reconnect.
+
+    Loads the persisted cache (first run only), then resumes the chat history scan after the
+    last message it covered, oldest first, checkpointing as it goes - a reconnect only reads
+    the gap. With no checkpoint it reads back to INACTIVE_AFTER ago, newest first (older
+    messages can't change any decision), and continues from where it got to. The scan stops after history_scan_budget seconds; returns False if it had to stop
+    early, the next run picks up from the checkpoint. A no-op once history is complete.
+    `progress`, if given, is awaited with the number of messages scanned so far.
+    """
+    async with _history_scan_lock:  # on_ready, on_resumed and member_checker can overlap
+        if _history_complete.is_set():
+            return True
+        return await _scan_activity_history(progress)
+
+
+async def _scan_activity_history(progress=None) -> bool:
+    global last_chat_message_id, _cold_scan
     chat = bot.get_channel(config.channels['chat'])
 
-    print('building activity cache...')
-    async for msg in chat.history(limit=10000):
-        ts = msg.created_at.timestamp()
+    if not _cache_loaded:
+        load_activity_cache()
+
+    deadline = time.monotonic() + config.timings['history_scan_budget']
+    scanned = 0
+    finished = True
+
+    if not last_chat_message_id:
+        # cold start: newest first, so running out of time leaves the least useful part unread.
+        # no checkpoint until the window is fully read, its newest end becomes the checkpoint then
+        print('building activity cache...')
+        if _cold_scan is None:
+            newest = discord.utils.time_snowflake(discord.utils.utcnow())
+            _cold_scan = (newest, newest)
+        newest, before = _cold_scan
+        cutoff = discord.utils.utcnow() - datetime.timedelta(seconds=INACTIVE_AFTER)
+
+        async for msg in chat.history(limit=None, before=discord.Object(id=before), after=cutoff, oldest_first=False):
+            _fold_history_message(msg)
+            _cold_scan = (newest, msg.id)
+            scanned += 1
+
+            if scanned % 500 == 0 and progress:
+                await progress(scanned)
+            if time.monotonic() > deadline:
+                finished = False
+                break
+
+        if finished:
+            _cold_scan = None
+            last_chat_message_id = newest
+    else:
+        print(f'activity cache has {len(last_activity_cache)} members, catching up on history...')
+
+    if finished:
+        # everything since the checkpoint, oldest first so it can move along as we go
+        history = chat.history(limit=None, after=discord.Object(id=last_chat_message_id), oldest_first=True)
+        async for msg in history:
+            _fold_history_message(msg)
+            if msg.id > last_chat_message_id:
+                last_chat_message_id = msg.id
+            scanned += 1
+
+            if scanned % 500 == 0:
+                _save_checkpoint()
+                if progress:
+                    await progress(scanned)
+            if time.monotonic() > deadline:
+                finished = False
+                break
+
+    if finished:
+        _history_complete.set()
+    _save_checkpoint()
+    compact_activity_cache()
+    print(f'cache built — scanned {scanned} messages, tracked {len(last_activity_cache)} members'
+          f'{"" if finished else " (time budget ran out, will resume next run)"}.')
+    return finished
+
+
+INACTIVE_AFTER = 6 * 24 * 60 * 60
+UNAVAILABLE_AFTER = 1.5 * 60 * 60
+
+
+async def _expire_member(guild: discord.Guild, m: discord.Member, now: float) -> None:
+    """Mark m inactive / unavailable if they're past the cutoffs."""
+    if m.bot or (m.voice and m.voice.channel):
+        return
+
+    last_ts = last_activity_cache.get(m.id, 0)
+    needs_inactive = (
+        not general.has_role(m, config.roles['inactive'])
+        and not general.has_role(m, config.roles['explained_inactive'])
+        and last_ts < now - INACTIVE_AFTER
+    )
+    needs_unavail = (
+        general.has_role(m, config.roles['available'])
+        and last_ts < now - UNAVAILABLE_AFTER
+    )
+
+    if not needs_inactive and not needs_unavail:
+        return
+
+    async with RoleSession(m, priority=BULK) as rs:
+        if needs_unavail:
+            bot_unavailable_pending.add(m.id)
+            rs.remove('available')
+            await general.remove_availability_reaction(guild, m)
+            await general.send(
+                config.message(
+                    'unavailable_auto_bot',
+                    name=m.mention,
+                    available_count=emojify(str(await count_available(guild)), 'b'),
+                ),
+                pings=discord.AllowedMentions.none(),
+            )
 
-        if not msg.author.bot:
-            if ts > last_activity_cache.get(msg.author.id, 0):
-                update_cache(msg.author.id, ts)
-        elif msg.author == bot.user:
-            if '<:join:1436503008924926052>' in msg.content:
-                for user_id in (int(x) for x in re.findall(r'\d{17,19}', msg.content)):
-                    if ts > last_activity_cache.get(user_id, 0):
-                        update_cache(user_id, ts)
+        if needs_inactive:
+            bot_inactive_pending.add(m.id)
+            rs.add('inactive')
+            rs.remove('person')
 
-    print(f'cache built — tracked {len(last_activity_cache)} members.')
+    general.mark_status_dirty()
 
 
 async def run_activity_checks() -> None:
     """
-    Called every 45 minutes by member_checker.
+    Full scan, used by the .check_inactive_people command (the expiry scheduler handles it otherwise).
     Marks members inactive if they haven't spoken in 6 days.
     Removes availability if they haven't been active in 1.5 hours.
     """
     guild = bot.get_guild(config.TARGET_GUILD)
     now = discord.utils.utcnow().timestamp()
-    cutoff_6d = now - (6 * 24 * 60 * 60)
-    cutoff_1h = now - (1.5 * 60 * 60)
-
-    availability_msg = None
 
     for m in guild.members:
-        if m.bot or (m.voice and m.voice.channel):
+        await _expire_member(guild, m, now)
+
+
+# ---------------------------------------------------------------------------
+# expiry scheduler: fires exactly when someone crosses a cutoff
+# ---------------------------------------------------------------------------
+
+# heap of (deadline, member id, cutoff). entries go stale when update_cache moves the
+# member's timestamp - they're recognised by deadline != last_ts + cutoff and skipped
+_deadlines: list[tuple[float, int, float]] = []
+_deadline_added: asyncio.Event | None = None
+_expiry_task: asyncio.Task | None = None
+
+
+def _push_deadlines(member_id: int, last_ts: float) -> None:
+    for cutoff in (UNAVAILABLE_AFTER, INACTIVE_AFTER):
+        heapq.heappush(_deadlines, (last_ts + cutoff, member_id, cutoff))
+
+
+def schedule_expiry(member_id: int) -> None:
+    """(Re)schedule a member's deadlines from their current cache timestamp."""
+    if _expiry_task is None:
+        return  # not started yet, seeding will cover it
+
+    head = _deadlines[0][0] if _deadlines else None
+    _push_deadlines(member_id, last_activity_cache.get(member_id, 0))
+
+    if len(_deadlines) > 8 * (len(last_activity_cache) + 1):  # 2 live entries per member, rest is stale
+        _rebuild_deadlines()
+    if head is None or _deadlines[0][0] < head:
+        _deadline_added.set()
+
+
+def _rebuild_deadlines(member_ids=None) -> None:
+    """Drop stale entries by rebuilding the heap from the cache."""
+    if member_ids is None:
+        member_ids = {m_id for _, m_id, _ in _deadlines}
+    _deadlines.clear()
+    for member_id in member_ids:
+        _push_deadlines(member_id, last_activity_cache.get(member_id, 0))
+    heapq.heapify(_deadlines)
+
+
+async def _run_expiry_scheduler() -> None:
+    while True:
+        if not _deadlines:
+            _deadline_added.clear()
+            await _deadline_added.wait()
             continue
 
-        last_ts = last_activity_cache.get(m.id, 0)
-        needs_inactive = (
-            not general.has_role(m, config.roles['inactive'])
-            and not general.has_role(m, config.roles['explained_inactive'])
-            and last_ts < cutoff_6d
-        )
-        needs_unavail = (
-            general.has_role(m, config.roles['available'])
-            and last_ts < cutoff_1h
-        )
+        deadline, member_id, cutoff = _deadlines[0]
+        delay = deadline - discord.utils.utcnow().timestamp()
+        if delay > 0:
+            _deadline_added.clear()
+            try:
+                await asyncio.wait_for(_deadline_added.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
 
-        if not needs_inactive and not needs_unavail:
+        if not _history_complete.is_set():
+            # activity we haven't scanned yet could push this back - wait until it's caught up
+            await _history_complete.wait()
             continue
 
-        async with RoleSession(m) as rs:
-            if needs_unavail:
-                bot_unavailable_pending.add(m.id)
-                if not availability_msg:
-                    ch = guild.get_channel(config.channels['availability'])
-                    availability_msg = await ch.fetch_message(
-                        config.channels['availability_message']
-                    )
-                rs.remove('available')
-                await availability_msg.remove_reaction(
-                    discord.PartialEmoji(
-                        id=config.channels['availability_reaction'],
-                        name='available',
-                    ),
-                    m,
-                )
-                await general.send(
-                    config.message(
-                        'unavailable_auto_bot',
-                        name=m.mention,
-                        available_count=emojify(str(await count_available(guild)), 'b'),
-                    ),
-                    pings=discord.AllowedMentions.none(),
-                )
+        heapq.heappop(_deadlines)
+        if deadline != last_activity_cache.get(member_id, 0) + cutoff:
+            continue  # stale, they've been active since
+
+        guild = bot.get_guild(config.TARGET_GUILD)
+        member = guild.get_member(member_id) if guild else None
+        if not member:
+            continue
+        try:
+            await _expire_member(guild, member, discord.utils.utcnow().timestamp())
+        except Exception as e:
+            print(f'expiry failed for {member_id}: {e}')
 
-            if needs_inactive:
-                bot_inactive_pending.add(m.id)
-                rs.add('inactive')
-                rs.remove('person')
 
-    await general.update_status()
+def start_expiry_scheduler(guild: discord.Guild) -> None:
+    """Seed deadlines for every member and start the scheduler (safe to call again on reconnect)."""
+    global _deadline_added, _expiry_task
+    if _deadline_added is None:
+        _deadline_added = asyncio.Event()
+
+    _rebuild_deadlines(m.id for m in guild.members if not m.bot)
+    if _expiry_task is None or _expiry_task.done():
+        _expiry_task = asyncio.create_task(_run_expiry_scheduler())
+    _deadline_added.set()
 
 
 # ---------------------------------------------------------------------------
@@ -292,12 +569,19 @@ INTERESTED_MESSAGE_BASE = 1464609114612302035
 INTERESTED_MESSAGE_STAR = 1467834855315210376
 INTERESTED_MESSAGE_ULTIMATE = 1467834856640745542
 
-user_pending_changes: dict = {}
-user_debounce_tasks: dict = {}
-user_initial_states: dict = {}
+# message id -> emoji string -> role; rebuilt lazily after role/emoji changes
+_interested_role_maps: dict[int, dict] = {}
+
+
+def invalidate_interested_role_maps() -> None:
+    _interested_role_maps.clear()
 
 
 def get_interested_role_map(guild: discord.Guild, message_id: int) -> dict:
+    cached = _interested_role_maps.get(message_id)
+    if cached is not None:
+        return cached
+
     role_map = {}
 
     if message_id == INTERESTED_MESSAGE_BASE:
@@ -309,6 +593,8 @@ def get_interested_role_map(guild: discord.Guild, message_id: int) -> dict:
     else:
         return role_map
 
+    emojis_by_name = {e.name: e for e in guild.emojis}
+
     for role in guild.roles:
         suffix = None
         for p in prefixes:
@@ -323,26 +609,17 @@ def get_interested_role_map(guild: discord.Guild, message_id: int) -> dict:
             continue
 
         clean = ''.join(c for c in suffix if c.isalnum() or c.isspace())
-        emoji = discord.utils.get(guild.emojis, name=f"badge_{clean.replace(' ', '_')}")
+        emoji = emojis_by_name.get(f"badge_{clean.replace(' ', '_')}")
         if emoji:
             role_map[str(emoji)] = role
 
+    _interested_role_maps[message_id] = role_map
     return role_map
 
 
-async def process_interested_changes(user_id: int, guild: discord.Guild) -> None:
-    if user_id not in user_pending_changes:
-        return
-
-    changes = user_pending_changes.pop(user_id)
-    initial = user_initial_states.pop(user_id, set())
-
-    final_roles = (initial | changes['added']) - changes['removed']
-    net_added = final_roles - initial
-    net_removed = initial - final_roles
-
+async def process_interested_changes(user_id: int, guild: discord.Guild, net_added: set, net_removed: set) -> None:
     member = guild.get_member(user_id)
-    if not member or (not net_added and not net_removed):
+    if not member:
         return
 
     async with RoleSession(member) as rs:
@@ -371,16 +648,7 @@ async def process_interested_changes(user_id: int, guild: discord.Guild) -> None
         await general.send('\n'.join(lines), pings=AllowedMentions.none())
 
 
-async def schedule_interested_debounce(user_id: int, guild: discord.Guild) -> None:
-    if user_id in user_debounce_tasks:
-        user_debounce_tasks[user_id].cancel()
-
-    async def _wait():
-        await asyncio.sleep(7)
-        await process_interested_changes(user_id, guild)
-        user_debounce_tasks.pop(user_id, None)
-
-    user_debounce_tasks[user_id] = asyncio.create_task(_wait())
+debounce.register('interested', process_interested_changes, 'reaction_interested')
 
 
 async def sync_interested_reactions() -> None:
@@ -1,8 +1,8 @@
 import discord
 from discord.ui import View, Select
-from modules.points import parse_challenge_role, get_ranked_leaderboard, sync_leaderboard_roles
+from modules.points import parse_challenge_role, get_ranked_leaderboard, sync_leaderboard_roles, set_display_opt_in
 from modules.role_management import RoleSession
-from modules import config
+from modules import config, message_registry
 
 WARDROBE_CHANNEL_ID = 1468068634680229979
 WARDROBE_CUSTOM_ID = "wardrobe:open"
@@ -242,8 +242,9 @@ class WardrobeSelect(Select):
             view=None,
         )
 
+        set_display_opt_in(member.id, choice == LEADERBOARD_OPTION_VALUE)
         ranked_leaderboard = get_ranked_leaderboard(member.guild)
-        await sync_leaderboard_roles(member.guild, ranked_leaderboard)
+        await sync_leaderboard_roles(member.guild, ranked_leaderboard, member_ids={member.id})
 
 
 # -------------------------
@@ -256,15 +257,20 @@ async def ensure_wardrobe_message(bot: discord.Client):
     if not channel:
         return
 
+    if await message_registry.fetch(channel, "wardrobe"):
+        return
+
     async for msg in channel.history(limit=25):
         if msg.author == bot.user and msg.components:
             for row in msg.components:
                 for c in row.children:
                     if getattr(c, "custom_id", None) == WARDROBE_CUSTOM_ID:
+                        message_registry.remember("wardrobe", msg.id)
                         return
 
-    await channel.send(
+    msg = await channel.send(
         WARDROBE_MESSAGE_TEXT,
         view=WardrobeOpenView(),
         allowed_mentions=discord.AllowedMentions.none(),
-    )
\ No newline at end of file
+    )
+    message_registry.remember("wardrobe", msg.id)
\ No newline at end of file
@@ -7,6 +7,9 @@ def check_guild(guild_id: int) -> bool:
         return True
     return False
 
+DATA_DIR = 'data'  # local state that survives restarts (gitignored)
+SWEEP_CONCURRENCY = 8  # members checked at once by the periodic member sweep
+
 from dotenv import dotenv_values
 TOKEN = dotenv_values('.env').get('TOKEN')
 if not TOKEN:
@@ -112,6 +115,23 @@ channels = {
     "leaderboard": 1456353494448734331,
 }
 
+# seconds
+timings = {
+    "leaderboard_flush": 5,  # coalesce leaderboard message edits into one per window
+    "role_commit": 0.5,  # merge RoleSession commits on the same member into one edit per window
+    "role_commit_trust": 5,  # how long our own edit beats a member cache that hasn't caught up yet
+    "presence": 15,  # at most one status recompute / presence update per this many seconds
+    "history_scan_budget": 120,  # max time the activity cache history scan may take per run
+    "reaction_interested": 7,  # quiet time before a burst of interested-role reactions is applied
+    "reaction_availability": 2,  # same, for the availability reaction
+    "reaction_roles": 2,  # same, for static reaction roles
+}
+
+# route -> (requests, per seconds), kept a bit under discord's buckets
+rate_limits = {
+    "member_edit": (8, 10),
+}
+
 emoji = {
     "join": "<:join:1436503008924926052>",
     "leave": "<:leave:1436503027937841173>",
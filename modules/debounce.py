@@ -0,0 +1,102 @@
+import asyncio
+import heapq
+import time
+
+import discord
+from modules import config
+
+# coalesces bursts of reaction toggles per (user, feature) into one net change,
+# so someone clicking a reaction on and off ten times costs at most one edit
+
+# feature -> (config.timings key for its window, flush)
+_features: dict[str, tuple[str, object]] = {}
+
+
+class _Burst:
+    """Toggles one user made on one feature since their window opened."""
+    __slots__ = ('guild', 'initial', 'held', 'due')
+
+    def __init__(self, guild: discord.Guild):
+        self.guild = guild
+        self.initial: dict = {}  # key -> held before the burst
+        self.held: dict = {}     # key -> held after the latest toggle
+        self.due = 0.0
+
+    def net(self) -> tuple[set, set]:
+        added = {k for k, held in self.held.items() if held and not self.initial[k]}
+        removed = {k for k, held in self.held.items() if not held and self.initial[k]}
+        return added, removed
+
+
+_bursts: dict[tuple[int, str], _Burst] = {}
+_due: list[tuple[float, int, str]] = []  # lazy heap, entries whose burst moved on are skipped
+_due_added: asyncio.Event | None = None
+_task: asyncio.Task | None = None
+_flush_tasks: set[asyncio.Task] = set()
+
+
+def register(feature: str, flush, window: str) -> None:
+    """flush(user_id, guild, added, removed) gets the net change once config.timings[window] passes quietly."""
+    _features[feature] = (window, flush)
+
+
+def toggle(feature: str, user_id: int, guild: discord.Guild, key, held: bool, was_held: bool) -> None:
+    """Record a toggle of key. was_held is the live state, only read on the first toggle of a burst."""
+    global _due_added, _task
+    window, _ = _features[feature]
+
+    burst = _bursts.get((user_id, feature))
+    if burst is None:
+        burst = _bursts[(user_id, feature)] = _Burst(guild)
+    burst.initial.setdefault(key, was_held)
+    burst.held[key] = held
+    burst.due = time.monotonic() + config.timings[window]
+
+    if _due_added is None:
+        _due_added = asyncio.Event()
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_run())
+
+    heapq.heappush(_due, (burst.due, user_id, feature))
+    if _due[0][0] == burst.due:
+        _due_added.set()
+
+
+async def _run() -> None:
+    while True:
+        if not _due:
+            _due_added.clear()
+            await _due_added.wait()
+            continue
+
+        due, user_id, feature = _due[0]
+        delay = due - time.monotonic()
+        if delay > 0:
+            _due_added.clear()
+            try:
+                await asyncio.wait_for(_due_added.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        heapq.heappop(_due)
+        burst = _bursts.get((user_id, feature))
+        if burst is None or burst.due != due:
+            continue  # stale, they toggled again since
+        del _bursts[(user_id, feature)]
+
+        added, removed = burst.net()
+        if not added and not removed:
+            continue
+        # own task per flush, so a slow one doesn't hold up everyone else's deadlines
+        task = asyncio.create_task(_flush(feature, user_id, burst.guild, added, removed))
+        _flush_tasks.add(task)
+        task.add_done_callback(_flush_tasks.discard)
+
+
+async def _flush(feature: str, user_id: int, guild: discord.Guild, added: set, removed: set) -> None:
+    _, flush = _features[feature]
+    try:
+        await flush(user_id, guild, added, removed)
+    except Exception as e:
+        print(f'{feature} flush failed for {user_id}: {e}')
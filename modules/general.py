@@ -1,6 +1,7 @@
 import asyncio
 import discord
 from discord import Guild
+from discord.ext import tasks
 from modules import config
 from modules.config import TARGET_GUILD
 from modules.bot_init import bot
@@ -10,7 +11,7 @@ async def send(msg: str, where: str = 'chat', pings: discord.AllowedMentions = N
     channel = bot.get_channel(config.channels[where])
     if channel:
         msg = await channel.send(msg, allowed_mentions=pings)
-    await update_status(bot)
+    mark_status_dirty()
     return msg
 
 async def timed_delete_msg(msg: discord.Message, text: str, duration: int = 10):
@@ -36,39 +37,138 @@ async def send_timed_delete_msg(text: str, duration: int = 10, where: str = 'cha
 
 
 
+ALTS_ROLE_ID = 1427013313837011175
+
+# ids of the members the status line counts (humans without the alts role);
+# kept by join/leave/role events, checked against a full count once per sweep
+_counted_members: set[int] | None = None
+
+
+def _is_counted(member: discord.Member) -> bool:
+    return not member.bot and not any(r.id == ALTS_ROLE_ID for r in member.roles)
+
+
+def recount_members(guild: Guild) -> int:
+    global _counted_members
+    if guild.get_role(ALTS_ROLE_ID) is None:
+        print(f"warning: role id {ALTS_ROLE_ID} not found")
+
+    counted = {m.id for m in guild.members if _is_counted(m)}
+    if _counted_members is not None and counted != _counted_members:
+        print(f'member count drifted: tracked {len(_counted_members)}, actual {len(counted)}')
+    _counted_members = counted
+    return len(counted)
+
+
+def note_member(member: discord.Member) -> None:
+    """Member joined or their alts role changed."""
+    if _counted_members is None:
+        return
+    if _is_counted(member):
+        _counted_members.add(member.id)
+    else:
+        _counted_members.discard(member.id)
+    mark_status_dirty()
+
+
+def forget_member(member_id: int) -> None:
+    if _counted_members is not None:
+        _counted_members.discard(member_id)
+    mark_status_dirty()
+
+
 async def count_filtered_members(guild: Guild) -> int:
-    excluded_role_id = 1427013313837011175 # alts
-    excluded_role = guild.get_role(excluded_role_id)
+    if _counted_members is None:
+        return recount_members(guild)
+    return len(_counted_members)
 
-    if excluded_role is None:
-        print(f"warning: role id {excluded_role_id} not found")
 
-    member_count = 0
-    for member in guild.members:
-        if member.bot:
-            continue
-        if excluded_role and excluded_role in member.roles:
-            continue
-        member_count += 1
-    return member_count
+# ids of everyone reacting on the availability message (the bot included).
+# loaded with one fetch per sweep and kept current from raw reaction events in between;
+# None until loaded (or when the message can't be read), empty if nobody has reacted
+availability_reactors: set[int] | None = None
+# reaction events that arrive while a load is paging through users, replayed onto the new set
+_reactor_events: list[tuple[int, bool]] | None = None
+_reactors_lock = asyncio.Lock()
 
-async def count_available(guild: discord.Guild) -> int:
+
+async def _load_availability_reactors(guild: discord.Guild) -> set[int] | None:
+    global availability_reactors, _reactor_events
     channel = guild.get_channel(config.channels['availability'])
+    _reactor_events = []
     try:
-        msg = await channel.fetch_message(config.channels['availability_message'])
-    except (discord.NotFound, discord.Forbidden):
-        return 0
-    found_reaction: discord.Reaction | None = None
-    for reaction in msg.reactions:
-        if reaction.emoji.id == config.channels['availability_reaction']:
-            found_reaction = reaction
-            break
-    if not found_reaction:
+        try:
+            msg = await channel.fetch_message(config.channels['availability_message'])
+        except (discord.NotFound, discord.Forbidden):
+            return None
+
+        reactors = set()
+        for reaction in msg.reactions:
+            if reaction.emoji.id == config.channels['availability_reaction']:
+                reactors = {user.id async for user in reaction.users()}
+                break
+        for user_id, added in _reactor_events:
+            if added:
+                reactors.add(user_id)
+            else:
+                reactors.discard(user_id)
+        # swap in only once complete, readers keep using the old set until then
+        availability_reactors = reactors
+        return reactors
+    finally:
+        _reactor_events = None
+
+
+async def load_availability_reactors(guild: discord.Guild) -> set[int] | None:
+    async with _reactors_lock:
+        return await _load_availability_reactors(guild)
+
+
+async def get_availability_reactors(guild: discord.Guild) -> set[int] | None:
+    if availability_reactors is None:
+        async with _reactors_lock:
+            if availability_reactors is None:  # someone else may have loaded it while we waited
+                return await _load_availability_reactors(guild)
+    return availability_reactors
+
+
+def note_availability_reaction(user_id: int, added: bool) -> None:
+    if _reactor_events is not None:
+        _reactor_events.append((user_id, added))
+    if availability_reactors is None:
+        return  # next load picks it up
+    if added:
+        availability_reactors.add(user_id)
+    else:
+        availability_reactors.discard(user_id)
+
+
+async def count_available(guild: discord.Guild) -> int:
+    """Live count from the reactor set - no HTTP once the set is loaded."""
+    reactors = await get_availability_reactors(guild)
+    if not reactors:
         return 0
-    count = found_reaction.count
-    if found_reaction.me:
-        count -= 1
-    return count
+    return len(reactors) - (guild.me.id in reactors)
+
+
+AVAILABILITY_EMOJI = discord.PartialEmoji(id=config.channels['availability_reaction'], name='available')
+
+
+def _availability_message(guild: discord.Guild) -> discord.PartialMessage:
+    return guild.get_channel(config.channels['availability']).get_partial_message(
+        config.channels['availability_message']
+    )
+
+
+async def remove_availability_reaction(guild: discord.Guild, user: discord.abc.Snowflake) -> None:
+    # update the set right away, the gateway echo of our own removal comes later
+    note_availability_reaction(user.id, False)
+    await _availability_message(guild).remove_reaction(AVAILABILITY_EMOJI, user)
+
+
+async def add_availability_reaction(guild: discord.Guild) -> None:
+    note_availability_reaction(guild.me.id, True)
+    await _availability_message(guild).add_reaction(AVAILABILITY_EMOJI)
 
 
 async def count_in_vc(guild: discord.Guild, vc: str = 'vc') -> int:
@@ -77,8 +177,35 @@ async def count_in_vc(guild: discord.Guild, vc: str = 'vc') -> int:
         return 0
     return len(channel.members)
 
+_last_presence: tuple[str, discord.Status | None] | None = None
+_status_dirty = True
+
+
 async def set_status(text: str, *, status: discord.Status = None) -> None:
+    global _last_presence
+    if (text, status) == _last_presence:
+        return  # presence updates are rate limited, don't spend one on a no-op
     await bot.change_presence(activity=discord.Activity(type=discord.ActivityType.watching, name=text), status=status)
+    _last_presence = (text, status)
+
+
+def mark_status_dirty() -> None:
+    """Something the status line shows changed; presence_updater picks it up on its next tick."""
+    global _status_dirty
+    _status_dirty = True
+
+
+@tasks.loop(seconds=config.timings['presence'])
+async def presence_updater():
+    if not _status_dirty:
+        return
+    try:
+        # keep whatever online/idle state was last set explicitly
+        await update_status(status=_last_presence[1] if _last_presence else None)
+    except Exception as e:
+        # an uncaught error would stop the loop for good, just try again next tick
+        print(f'presence update failed: {e}')
+        mark_status_dirty()
 
 
 async def get_status_text(guild: discord.Guild) -> str:
@@ -111,9 +238,11 @@ async def get_status_text(guild: discord.Guild) -> str:
 
 
 async def update_status(status: discord.Status = None) -> None:
+    global _status_dirty
     guild = bot.get_guild(config.TARGET_GUILD)
     if not guild:
         return
+    _status_dirty = False
     status_text = await get_status_text(guild)
     await set_status(status_text, status=status)
 
@@ -0,0 +1,57 @@
+import json
+import os
+
+import discord
+from modules import config
+
+# ids of messages the bot owns and keeps editing (leaderboard, wardrobe, ...),
+# so we don't have to find them again by scanning channel history
+_PATH = os.path.join(config.DATA_DIR, 'bot_messages.json')
+
+_ids: dict[str, int] | None = None
+
+
+def _load() -> dict[str, int]:
+    global _ids
+    if _ids is None:
+        try:
+            with open(_PATH, encoding='utf-8') as f:
+                _ids = {k: int(v) for k, v in json.load(f).items()}
+        except (FileNotFoundError, ValueError):
+            _ids = {}
+    return _ids
+
+
+def _save() -> None:
+    os.makedirs(config.DATA_DIR, exist_ok=True)
+    tmp = f'{_PATH}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(_load(), f)
+    os.replace(tmp, _PATH)
+
+
+def get(key: str) -> int | None:
+    return _load().get(key)
+
+
+def remember(key: str, message_id: int) -> None:
+    if _load().get(key) != message_id:
+        _ids[key] = message_id
+        _save()
+
+
+def forget(key: str) -> None:
+    if _load().pop(key, None) is not None:
+        _save()
+
+
+async def fetch(channel: discord.TextChannel, key: str) -> discord.Message | None:
+    """Fetch a registered message, dropping the id if it no longer exists."""
+    message_id = get(key)
+    if not message_id:
+        return None
+    try:
+        return await channel.fetch_message(message_id)
+    except discord.NotFound:
+        forget(key)
+        return None
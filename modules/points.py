@@ -1,8 +1,12 @@
+import asyncio
 import re
+from bisect import bisect_left, insort
 import discord
+import numpy as np
 from typing import Optional, List, Tuple
-from modules import config
+from modules import config, message_registry
 from modules.role_management import RoleSession
+from modules.role_scheduler import BULK
 
 LB_EMOJI = {
     1: config.emoji["lb_top_1"],
@@ -25,8 +29,7 @@ DISPLAY_ROLES = {
 DISPLAY_NOT_TOP = config.roles["lb_display_not_top"]
 
 
-def parse_challenge_role(role: discord.Role) -> Optional[dict]:
-    """Parse a challenge role and extract information."""
+def _parse_challenge_role_name(role: discord.Role) -> Optional[dict]:
     if not role.name.startswith('🏆') and not role.name.startswith('💠'):
         return None
 
@@ -41,10 +44,75 @@ def parse_challenge_role(role: discord.Role) -> Optional[dict]:
         'tier_emoji': tier_emoji,
         'name': name,
         'points': int(points),
-        'role': role.id
+        'role': role.id,
+        'custom': role.name.startswith('💠'),
     }
 
 
+# ---------------------------------------------------------------------------
+# challenge role registry
+# ---------------------------------------------------------------------------
+
+# role id -> parsed challenge info, or None for roles that aren't challenges
+_challenge_registry: dict[int, Optional[dict]] = {}
+
+
+# tier combination -> ids of every official, non-zero challenge role in those tiers
+_tier_required: dict[frozenset[str], frozenset[int]] = {}
+
+COMPLETION_TIERS = (frozenset({"🟢"}), frozenset({"⭐", "☄"}))
+
+
+def build_challenge_registry(guild: discord.Guild) -> None:
+    """Parse every guild role once. Runs on startup."""
+    _challenge_registry.clear()
+    for role in guild.roles:
+        _challenge_registry[role.id] = _parse_challenge_role_name(role)
+    _tier_required.clear()
+    for tiers in COMPLETION_TIERS:
+        required_challenge_ids(tiers)
+
+
+def register_role(role: discord.Role) -> bool:
+    """Re-parse a created/updated role. Returns True if its challenge info changed."""
+    old = _challenge_registry.get(role.id)
+    new = _parse_challenge_role_name(role)
+    _challenge_registry[role.id] = new
+    if old != new:
+        _tier_required.clear()
+        return True
+    return False
+
+
+def unregister_role(role_id: int) -> bool:
+    """Forget a deleted role. Returns True if it was a challenge role."""
+    if _challenge_registry.pop(role_id, None) is not None:
+        _tier_required.clear()
+        return True
+    return False
+
+
+def required_challenge_ids(tiers: set[str]) -> frozenset[int]:
+    key = frozenset(tiers)
+    required = _tier_required.get(key)
+    if required is None:
+        required = frozenset(
+            role_id for role_id, info in _challenge_registry.items()
+            if info and info['tier_emoji'] in key and info['points'] > 0 and not info['custom']
+        )
+        _tier_required[key] = required
+    return required
+
+
+def parse_challenge_role(role: discord.Role) -> Optional[dict]:
+    """Parse a challenge role and extract information."""
+    try:
+        return _challenge_registry[role.id]
+    except KeyError:
+        # not registered (yet, or already deleted) - parse without caching
+        return _parse_challenge_role_name(role)
+
+
 def calculate_points(member: discord.Member) -> tuple[int, List[int]]:
     total = 0
     challenge_roles = []
@@ -57,135 +125,268 @@ def calculate_points(member: discord.Member) -> tuple[int, List[int]]:
     return total, [role_id for _, role_id in challenge_roles]
 
 
+# ---------------------------------------------------------------------------
+# bulk path: member x challenge incidence matrix
+# ---------------------------------------------------------------------------
+
+class ChallengeMatrix:
+    """Snapshot of which member owns which challenge role, for full recomputes.
+
+    incidence[i, j] is True when member_ids[i] owns challenge_ids[j];
+    totals, ranks and completion all come out of numpy reductions on it.
+    """
+
+    def __init__(self, guild: discord.Guild):
+        if not _challenge_registry:
+            build_challenge_registry(guild)
+
+        self.challenge_ids = [role_id for role_id, info in _challenge_registry.items() if info]
+        self.points = np.array(
+            [_challenge_registry[role_id]['points'] for role_id in self.challenge_ids], dtype=np.int64
+        )
+        column = {role_id: j for j, role_id in enumerate(self.challenge_ids)}
+
+        members = [m for m in guild.members if not m.bot]
+        self.member_ids = [m.id for m in members]
+
+        rows, cols = [], []
+        for i, member in enumerate(members):
+            for role in member.roles:
+                j = column.get(role.id)
+                if j is not None:
+                    rows.append(i)
+                    cols.append(j)
+
+        self.incidence = np.zeros((len(members), len(self.challenge_ids)), dtype=bool)
+        self.incidence[rows, cols] = True
+
+    def totals(self) -> np.ndarray:
+        """Points per member."""
+        return self.incidence @ self.points
+
+    def ranks(self) -> np.ndarray:
+        """Dense leaderboard rank per member (1 = top), 0 for members without points."""
+        totals = self.totals()
+        scores = np.unique(totals[totals > 0])
+        ranks = len(scores) - np.searchsorted(scores, totals)
+        return np.where(totals > 0, ranks, 0)
+
+    def has_all(self, tiers: set[str]) -> np.ndarray:
+        """Per member, whether they own every required challenge of the given tiers."""
+        required = required_challenge_ids(tiers)
+        mask = np.array([role_id in required for role_id in self.challenge_ids], dtype=bool)
+        if not mask.any():
+            return np.zeros(len(self.member_ids), dtype=bool)
+        return self.incidence[:, mask].all(axis=1)
+
+    def completion_counts(self) -> dict[int, int]:
+        """How many members completed each challenge, by role id."""
+        return dict(zip(self.challenge_ids, self.incidence.sum(axis=0).tolist()))
+
+
+# ---------------------------------------------------------------------------
+# leaderboard index
+# ---------------------------------------------------------------------------
+
+_lb_guild_id: int | None = None
+_lb_points: dict[int, int] = {}        # member id -> points (only ranked members, points > 0)
+_lb_members: dict[int, set[int]] = {}  # points -> member ids with exactly that many points
+_lb_scores: list[int] = []             # distinct point values, ascending
+
+
+def _lb_set(member_id: int, points: int) -> None:
+    old = _lb_points.pop(member_id, None)
+    if old is not None:
+        bucket = _lb_members[old]
+        bucket.discard(member_id)
+        if not bucket:
+            del _lb_members[old]
+            del _lb_scores[bisect_left(_lb_scores, old)]
+
+    if points <= 0:
+        return
+
+    _lb_points[member_id] = points
+    bucket = _lb_members.get(points)
+    if bucket is None:
+        _lb_members[points] = {member_id}
+        insort(_lb_scores, points)
+    else:
+        bucket.add(member_id)
+
+
+def build_leaderboard_index(guild: discord.Guild) -> None:
+    """Rebuild the leaderboard index from scratch. Runs on startup and after role re-weights."""
+    global _lb_guild_id
+    _lb_points.clear()
+    _lb_members.clear()
+    _lb_scores.clear()
+    _lb_guild_id = guild.id
+
+    matrix = ChallengeMatrix(guild)
+    for member_id, total in zip(matrix.member_ids, matrix.totals().tolist()):
+        _lb_set(member_id, total)
+
+
+def _ensure_index(guild: discord.Guild) -> None:
+    if _lb_guild_id != guild.id:
+        build_leaderboard_index(guild)
+
+
+def refresh_member_points(member: discord.Member) -> int:
+    """Recalculate one member's points and patch the index. Returns their new total."""
+    _ensure_index(member.guild)
+    if member.bot:
+        _lb_set(member.id, 0)
+        return 0
+    total, _ = calculate_points(member)
+    _lb_set(member.id, total)
+    return total
+
+
+def drop_member_points(guild: discord.Guild, member_id: int) -> None:
+    """Remove a member from the index (left the server)."""
+    _ensure_index(guild)
+    _lb_set(member_id, 0)
+
+
 def get_leaderboard(guild: discord.Guild) -> List[Tuple[discord.Member, int]]:
     """Get leaderboard sorted by points."""
     leaderboard = []
-
-    for member in guild.members:
-        if member.bot:
-            continue
-        total_points, _ = calculate_points(member)
-        if total_points > 0:
-            leaderboard.append((member, total_points))
-
-    leaderboard.sort(key=lambda x: (-x[1], x[0].id))
+    for _, points, members in get_ranked_leaderboard(guild):
+        leaderboard.extend((m, points) for m in members)
     return leaderboard
 
 
 def get_ranked_leaderboard(guild: discord.Guild) -> list[tuple[int, int, list[discord.Member]]]:
-    leaderboard = get_leaderboard(guild)
+    _ensure_index(guild)
 
     ranked_entries: list[tuple[int, int, list[discord.Member]]] = []
-    previous_points = None
     unique_rank = 0
 
-    for member, points in leaderboard:
-        if points != previous_points:
-            unique_rank += 1
-            ranked_entries.append((unique_rank, points, [member]))
-        else:
-            ranked_entries[-1][2].append(member)
-        previous_points = points
+    for points in reversed(_lb_scores):
+        members = [
+            m for m in (guild.get_member(m_id) for m_id in sorted(_lb_members[points]))
+            if m is not None
+        ]
+        if not members:
+            continue
+        unique_rank += 1
+        ranked_entries.append((unique_rank, points, members))
 
     return ranked_entries
 
 
 def get_member_rank(guild: discord.Guild, member: discord.Member) -> Optional[int]:
     """Get the leaderboard rank of a member (1-indexed). Returns None if not ranked."""
-    ranked_lb = get_ranked_leaderboard(guild)
-    for rank, _, members in ranked_lb:
-        if member in members:
-            return rank
-    return None
+    _ensure_index(guild)
+    points = _lb_points.get(member.id)
+    if points is None:
+        return None
+    return len(_lb_scores) - bisect_left(_lb_scores, points)
 
 
 def has_all_challenges(member: discord.Member, tiers: set[str]) -> bool:
     """Check if member has all challenge roles for given tiers."""
-    all_required_roles = [
-        r for r in member.guild.roles
-        if parse_challenge_role(r)
-           and parse_challenge_role(r)["tier_emoji"] in tiers
-           and parse_challenge_role(r)["points"] > 0
-           and not r.name.startswith("💠")
-    ]
-
-    owned = {
-        r.id for r in member.roles
-        if parse_challenge_role(r)
-           and parse_challenge_role(r)["tier_emoji"] in tiers
-           and parse_challenge_role(r)["points"] > 0
-           and not r.name.startswith("💠")
-    }
+    if not _challenge_registry:
+        build_challenge_registry(member.guild)
+    required = required_challenge_ids(tiers)
+    return bool(required) and required <= {r.id for r in member.roles}
 
-    return len(all_required_roles) > 0 and all(r.id in owned for r in all_required_roles)
 
+# ---------------------------------------------------------------------------
+# leaderboard role sync
+# ---------------------------------------------------------------------------
 
-async def sync_leaderboard_roles(guild: discord.Guild, ranked_leaderboard: list):
-    """Sync leaderboard roles for all members based on their rank."""
-    top_map = {}
+ALL_DISPLAY_ROLES = (*DISPLAY_ROLES.values(), DISPLAY_NOT_TOP)
+
+_synced_top_map: dict[int, int] | None = None  # member id -> rank (1-3) as last written to discord
+_display_opt_ins: set[int] = set()               # member ids showing their leaderboard rank
+
+
+def _load_synced_state(guild: discord.Guild) -> set[int]:
+    """Read the current role holders on first sync. Returns every member worth re-checking."""
+    global _synced_top_map
+    _synced_top_map = {}
+    _display_opt_ins.clear()
+
+    for rank, role_id in TOP_ROLES.items():
+        role = guild.get_role(role_id)
+        if role:
+            for m in role.members:
+                _synced_top_map[m.id] = rank
 
+    for role_id in ALL_DISPLAY_ROLES:
+        role = guild.get_role(role_id)
+        if role:
+            _display_opt_ins.update(m.id for m in role.members)
+
+    return set(_synced_top_map) | _display_opt_ins
+
+
+def set_display_opt_in(member_id: int, opted_in: bool) -> None:
+    if opted_in:
+        _display_opt_ins.add(member_id)
+    else:
+        _display_opt_ins.discard(member_id)
+
+
+def note_display_roles(member: discord.Member) -> None:
+    """Refresh a member's opt-in state after their display roles changed."""
+    set_display_opt_in(member.id, any(r.id in ALL_DISPLAY_ROLES for r in member.roles))
+
+
+async def sync_leaderboard_roles(guild: discord.Guild, ranked_leaderboard: list, member_ids: set[int] = None):
+    """Sync leaderboard roles for members whose top-3 rank moved since the last sync.
+
+    member_ids forces a re-check for specific members (e.g. right after a wardrobe pick).
+    """
+    candidates = set(member_ids or ())
+    if _synced_top_map is None:
+        candidates |= _load_synced_state(guild)
+
+    top_map = {}
     for rank, _, members in ranked_leaderboard:
         if rank > 3:
             break
         for m in members:
             top_map[m.id] = rank
 
-    for member in guild.members:
-        if member.bot:
+    candidates |= {m_id for m_id in top_map.keys() | _synced_top_map.keys()
+                   if top_map.get(m_id) != _synced_top_map.get(m_id)}
+
+    for member_id in candidates:
+        member = guild.get_member(member_id)
+        if not member or member.bot:
             continue
 
-        async with RoleSession(member) as rs:
-            rs.remove(
-                config.roles["lb_top_1"],
-                config.roles["lb_top_2"],
-                config.roles["lb_top_3"],
-            )
+        async with RoleSession(member, priority=BULK) as rs:
+            rs.remove(*TOP_ROLES.values())
 
             rank = top_map.get(member.id)
             if rank:
                 rs.add(TOP_ROLES[rank])
 
-            has_display_opt_in = any(
-                r.id in (
-                    config.roles["lb_display_top_1"],
-                    config.roles["lb_display_top_2"],
-                    config.roles["lb_display_top_3"],
-                    config.roles["lb_display_not_top"],
-                )
-                for r in member.roles
-            )
-
-            if has_display_opt_in:
-                rs.remove(
-                    config.roles["lb_display_top_1"],
-                    config.roles["lb_display_top_2"],
-                    config.roles["lb_display_top_3"],
-                    config.roles["lb_display_not_top"],
-                )
+            if member.id in _display_opt_ins:
+                rs.remove(*ALL_DISPLAY_ROLES)
 
                 if rank:
                     rs.add(DISPLAY_ROLES[rank])
                 else:
                     rs.add(DISPLAY_NOT_TOP)
 
+    _synced_top_map.clear()
+    _synced_top_map.update(top_map)
 
-async def update_leaderboard_message(bot, guild: discord.Guild):
-    """Update the leaderboard message in the leaderboard channel."""
-    from modules import config
-
-    channel = guild.get_channel(config.channels['leaderboard'])
-    if not channel:
-        return
-
-    ranked_leaderboard = get_ranked_leaderboard(guild)
 
+def render_leaderboard(ranked_leaderboard: list) -> str:
     lines = ['# __THE LEADERBOARD__', '\n-# ** **']
 
     for rank_idx, (actual_rank, points, members) in enumerate(ranked_leaderboard):
         if rank_idx >= 15:
             break
 
-        members.sort(key=lambda m: m.display_name.lower())
+        members = sorted(members, key=lambda m: m.display_name.lower())
         member_mentions = ' '.join(member.mention for member in members)
 
         display_rank = rank_idx + 1
@@ -205,7 +406,23 @@ async def update_leaderboard_message(bot, guild: discord.Guild):
     if len(lines) <= 2:
         lines.append('no one on the leaderboard yet!')
 
-    message_text = '\n'.join(lines)
+    return '\n'.join(lines)
+
+
+_lb_last_text: str | None = None
+
+
+async def _write_leaderboard_message(bot, channel: discord.TextChannel, message_text: str) -> None:
+    message_id = message_registry.get('leaderboard')
+    if message_id:
+        try:
+            # partial message: edit by id without fetching it first
+            await channel.get_partial_message(message_id).edit(
+                content=message_text, allowed_mentions=discord.AllowedMentions.none()
+            )
+            return
+        except discord.NotFound:
+            message_registry.forget('leaderboard')
 
     bot_message = None
     async for msg in channel.history(limit=10):
@@ -216,6 +433,50 @@ async def update_leaderboard_message(bot, guild: discord.Guild):
     if bot_message:
         await bot_message.edit(content=message_text, allowed_mentions=discord.AllowedMentions.none())
     else:
-        await channel.send(message_text, allowed_mentions=discord.AllowedMentions.none())
+        bot_message = await channel.send(message_text, allowed_mentions=discord.AllowedMentions.none())
+    message_registry.remember('leaderboard', bot_message.id)
+
+
+async def update_leaderboard_message(bot, guild: discord.Guild):
+    """Update the leaderboard message in the leaderboard channel."""
+    global _lb_last_text
+
+    channel = guild.get_channel(config.channels['leaderboard'])
+    if not channel:
+        return
+
+    ranked_leaderboard = get_ranked_leaderboard(guild)
+    message_text = render_leaderboard(ranked_leaderboard)
+
+    if message_text != _lb_last_text:
+        await _write_leaderboard_message(bot, channel, message_text)
+        _lb_last_text = message_text
+
+    await sync_leaderboard_roles(guild, ranked_leaderboard)
+
+
+# ---------------------------------------------------------------------------
+# leaderboard update scheduler
+# ---------------------------------------------------------------------------
+
+_lb_dirty = False
+_lb_flush_task: asyncio.Task | None = None
+
+
+def schedule_leaderboard_update(bot, guild: discord.Guild) -> None:
+    """Mark the leaderboard dirty; it gets flushed once per leaderboard_flush window."""
+    global _lb_dirty, _lb_flush_task
+    _lb_dirty = True
+    if _lb_flush_task is None or _lb_flush_task.done():
+        _lb_flush_task = asyncio.create_task(_flush_leaderboard(bot, guild))
+
 
-    await sync_leaderboard_roles(guild, ranked_leaderboard)
\ No newline at end of file
+async def _flush_leaderboard(bot, guild: discord.Guild) -> None:
+    global _lb_dirty
+    while _lb_dirty:
+        await asyncio.sleep(config.timings['leaderboard_flush'])
+        _lb_dirty = False
+        try:
+            await update_leaderboard_message(bot, guild)
+        except Exception as e:
+            print(f'leaderboard update failed: {e}')
@@ -0,0 +1,119 @@
+import os
+import sqlite3
+import time
+
+from modules import config
+
+# append-only log of every challenge grant/revoke, so history questions
+# ("rank of X over time", "top movers this week") don't need discord scraping
+_PATH = os.path.join(config.DATA_DIR, 'points_history.sqlite3')
+
+# role_id of snapshot rows - a state the log didn't see happen, not a grant/revoke
+BASELINE_ROLE_ID = 0
+
+_conn: sqlite3.Connection | None = None
+
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        os.makedirs(config.DATA_DIR, exist_ok=True)
+        _conn = sqlite3.connect(_PATH)
+        _conn.executescript("""
+            CREATE TABLE IF NOT EXISTS point_events (
+                ts        REAL    NOT NULL,
+                member_id INTEGER NOT NULL,
+                role_id   INTEGER NOT NULL,
+                delta     INTEGER NOT NULL,
+                total     INTEGER NOT NULL,
+                rank      INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_point_events_member_ts ON point_events (member_id, ts);
+            CREATE INDEX IF NOT EXISTS idx_point_events_ts ON point_events (ts);
+        """)
+    return _conn
+
+
+def record(member_id: int, role_id: int, delta: int, total: int, rank: int | None, ts: float = None) -> None:
+    """Append one grant (delta > 0) or revoke (delta < 0) with the member's resulting total and rank."""
+    db = _db()
+    db.execute(
+        'INSERT INTO point_events (ts, member_id, role_id, delta, total, rank) VALUES (?, ?, ?, ?, ?, ?)',
+        (ts or time.time(), member_id, role_id, delta, total, rank),
+    )
+    db.commit()
+
+
+def snapshot(standings, ts: float = None) -> int:
+    """Log a baseline row for every member whose total differs from their latest logged one.
+
+    standings is (member_id, total, rank) for every ranked member; anyone logged with points
+    who's missing from it is logged at 0. Catches what the event log can't see - points held
+    before it existed, changes while the bot was offline, challenge re-weights and deletions.
+    A member's first row carries delta 0. Returns the number of rows written.
+    """
+    db = _db()
+    ts = ts or time.time()
+    latest = dict(db.execute(
+        'SELECT member_id, total FROM point_events WHERE rowid IN ('
+        '    SELECT MAX(rowid) FROM point_events GROUP BY member_id'
+        ')'
+    ).fetchall())
+
+    rows = []
+    for member_id, total, rank in standings:
+        last = latest.pop(member_id, None)
+        if total != last:
+            delta = 0 if last is None else total - last
+            rows.append((ts, member_id, BASELINE_ROLE_ID, delta, total, rank))
+    for member_id, last in latest.items():
+        if last:
+            rows.append((ts, member_id, BASELINE_ROLE_ID, -last, 0, None))
+
+    db.executemany(
+        'INSERT INTO point_events (ts, member_id, role_id, delta, total, rank) VALUES (?, ?, ?, ?, ?, ?)',
+        rows,
+    )
+    db.commit()
+    return len(rows)
+
+
+def rank_history(member_id: int, since: float = 0) -> list[tuple[float, int, int | None]]:
+    """(ts, total, rank) for every change of one member, oldest first."""
+    return _db().execute(
+        'SELECT ts, total, rank FROM point_events WHERE member_id = ? AND ts >= ? ORDER BY ts',
+        (member_id, since),
+    ).fetchall()
+
+
+def top_movers(since: float, limit: int = 10) -> list[tuple[int, int]]:
+    """(member_id, points gained) since a timestamp, biggest gain first."""
+    return _db().execute(
+        'SELECT member_id, SUM(delta) AS gained FROM point_events WHERE ts >= ? '
+        'GROUP BY member_id HAVING gained != 0 ORDER BY gained DESC LIMIT ?',
+        (since, limit),
+    ).fetchall()
+
+
+def leaderboard_as_of(ts: float) -> list[tuple[int, int, int]]:
+    """(rank, points, member_id) as the leaderboard stood at a timestamp, using dense ranks.
+
+    Only accurate back to the first snapshot(), before that the log only knows about grants it saw.
+    """
+    # rows are appended in time order, so the highest rowid per member is their latest state
+    rows = _db().execute(
+        'SELECT member_id, total FROM point_events WHERE rowid IN ('
+        '    SELECT MAX(rowid) FROM point_events WHERE ts <= ? GROUP BY member_id'
+        ') AND total > 0 ORDER BY total DESC, member_id',
+        (ts,),
+    ).fetchall()
+
+    ranked = []
+    rank = 0
+    previous = None
+    for member_id, total in rows:
+        if total != previous:
+            rank += 1
+            previous = total
+        ranked.append((rank, total, member_id))
+    return ranked
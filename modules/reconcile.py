@@ -0,0 +1,98 @@
+import asyncio
+
+import discord
+
+from modules import config, activity
+from modules.general import load_availability_reactors
+from modules.role_management import RoleSession, final_role_ids
+from modules.role_scheduler import BULK
+
+VOICE_ROLES = (
+    ('vc', 'in_vc'),
+    ('vc2', 'in_vc_2'),
+    ('vc3', 'in_vc_3'),
+)
+
+# bulk role reconciliation: work out the roles every member should have from cached
+# state only (roles, voice states, one read of the availability reactions, join dates)
+# using the same rules RoleSession commits apply, then apply just the diffs.
+# reconcile itself sends nothing; on_member_update still announces what it always does
+# (e.g. newbie graduation), except availability removals, which are marked bot-initiated.
+
+
+def desired_role_ids(member: discord.Member, available_ids: set[int] | None) -> set[int]:
+    current = {r.id for r in member.roles}
+    to_add, to_remove = set(), set()
+
+    def want(key: str, condition: bool):
+        (to_add if condition else to_remove).add(config.roles[key])
+
+    # availability (skipped if the reaction couldn't be read, like availability_check does)
+    if available_ids is not None:
+        is_available = member.id in available_ids
+        want('available', is_available)
+        want('not_available', not is_available)
+
+    # voice
+    voice_channel = member.voice.channel if member.voice else None
+    for vc, vc_role in VOICE_ROLES:
+        want(vc_role, voice_channel is not None and voice_channel.id == config.channels[vc])
+
+    # newbie expiry
+    days = activity.check_member_join_date(member)
+    if days is not None and days > activity.NEWBIE_DAYS:
+        to_remove.add(config.roles['newbie'])
+
+    return final_role_ids(member, current, to_add, to_remove)
+
+
+async def build_plan(guild: discord.Guild) -> list[tuple[discord.Member, set[int], set[int]]]:
+    """(member, role ids to add, role ids to remove) for every member whose roles are off."""
+    available_ids = await load_availability_reactors(guild)
+
+    plan = []
+    for member in guild.members:
+        if member.bot:
+            continue
+        current = {r.id for r in member.roles}
+        desired = desired_role_ids(member, available_ids)
+        if desired != current:
+            plan.append((member, desired - current, current - desired))
+    return plan
+
+
+def format_plan(guild: discord.Guild, plan: list) -> list[str]:
+    def names(role_ids: set[int]) -> str:
+        return ', '.join(sorted(guild.get_role(r).name if guild.get_role(r) else str(r) for r in role_ids))
+
+    lines = []
+    for member, added, removed in plan:
+        parts = []
+        if added:
+            parts.append(f'+ {names(added)}')
+        if removed:
+            parts.append(f'- {names(removed)}')
+        lines.append(f'{member.display_name}: {" / ".join(parts)}')
+    return lines
+
+
+async def reconcile(guild: discord.Guild, dry_run: bool = False) -> list:
+    """Compute the plan and apply every non-empty diff (or just print it on a dry run)."""
+    plan = await build_plan(guild)
+
+    if dry_run:
+        for line in format_plan(guild, plan):
+            print(f'reconcile (dry run) - {line}')
+        return plan
+
+    async def apply(member, added, removed):
+        if config.roles['available'] in removed:
+            # bot-initiated, or on_member_update announces it as a mod removing the role
+            activity.bot_unavailable_pending.add(member.id)
+        async with RoleSession(member, priority=BULK) as rs:
+            rs.add(*added)
+            rs.remove(*removed)
+
+    # the role scheduler paces the actual edits
+    await asyncio.gather(*(apply(*diff) for diff in plan))
+    return plan
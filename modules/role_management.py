@@ -1,9 +1,20 @@
+import asyncio
+import time
+
 import discord
-from modules import config
+from modules import config, role_scheduler
+
+
+# guild id -> [(category role id, frozenset of sub role ids, "🚫 none" role id or None)]
+_hierarchy_cache: dict[int, list[tuple[int, frozenset[int], int | None]]] = {}
+
 
+def _get_role_hierarchy(guild: discord.Guild) -> list[tuple[int, frozenset[int], int | None]]:
+    cached = _hierarchy_cache.get(guild.id)
+    if cached is not None:
+        return cached
 
-def _get_role_hierarchy(guild: discord.Guild):
-    # categories[category_role] = { 'roles': [list], 'none_role': discord.Role or None }
+    # categories[category_role_id] = { 'roles': [role ids], 'none_role': role id or None }
     categories = {}
     current_category = None
 
@@ -11,7 +22,7 @@ def _get_role_hierarchy(guild: discord.Guild):
 
     for role in sorted_roles:
         if role.name.startswith("──╱") and role.name.endswith("─"):
-            current_category = role
+            current_category = role.id
             categories[current_category] = {'roles': [], 'none_role': None}
             continue
 
@@ -20,48 +31,53 @@ def _get_role_hierarchy(guild: discord.Guild):
                 current_category = None
                 continue
             if role.name == "🚫 none":
-                categories[current_category]['none_role'] = role
+                categories[current_category]['none_role'] = role.id
             elif role.name.strip() == "":
                 continue
             else:
-                categories[current_category]['roles'].append(role)
+                categories[current_category]['roles'].append(role.id)
 
-    return categories
+    hierarchy = [
+        (cat_id, frozenset(data['roles']), data['none_role'])
+        for cat_id, data in categories.items()
+    ]
+    _hierarchy_cache[guild.id] = hierarchy
+    return hierarchy
 
 
-def _fix_categories(current_roles: set, guild: discord.Guild) -> set:
-    hierarchy = _get_role_hierarchy(guild)
+def invalidate_role_hierarchy(guild: discord.Guild) -> None:
+    """Drop the cached hierarchy. Call on any role create/update/delete (incl. position moves)."""
+    _hierarchy_cache.pop(guild.id, None)
 
-    for cat_role, data in hierarchy.items():
-        sub_roles = set(data['roles'])
-        none_role = data['none_role']
-        has_sub_roles = any(r in current_roles for r in sub_roles)
+
+def _fix_categories(current_ids: set[int], guild: discord.Guild) -> set[int]:
+    for cat_id, sub_ids, none_id in _get_role_hierarchy(guild):
+        has_sub_roles = not sub_ids.isdisjoint(current_ids)
 
         if has_sub_roles:
-            current_roles.add(cat_role)
-            if none_role:
-                current_roles.discard(none_role)
+            current_ids.add(cat_id)
+            if none_id:
+                current_ids.discard(none_id)
         else:
-            if none_role:
-                current_roles.add(cat_role)
-                current_roles.add(none_role)
+            if none_id:
+                current_ids.add(cat_id)
+                current_ids.add(none_id)
             else:
-                current_roles.discard(cat_role)
+                current_ids.discard(cat_id)
 
-    return current_roles
+    return current_ids
 
 
-def _ensure_roles(current_roles: set, guild: discord.Guild) -> set:
+def _ensure_roles(current_ids: set[int], guild: discord.Guild) -> set[int]:
     def has(role_id):
-        return any(r.id == role_id for r in current_roles)
+        return role_id in current_ids
 
     def update(role_id, condition):
-        role = guild.get_role(role_id)
-        if not role: return
         if condition:
-            current_roles.add(role)
+            if guild.get_role(role_id):
+                current_ids.add(role_id)
         else:
-            current_roles.discard(role)
+            current_ids.discard(role_id)
 
     is_leader = has(config.roles['leader'])
     is_available = has(config.roles['available'])
@@ -84,7 +100,7 @@ def _ensure_roles(current_roles: set, guild: discord.Guild) -> set:
         update(config.roles['explained_inactive'], False)
         update(config.roles['person'], True)
 
-    return current_roles
+    return current_ids
 
 
 def _resolve_to_id(role_input) -> int | None:
@@ -98,11 +114,130 @@ def _resolve_to_id(role_input) -> int | None:
     return None
 
 
+def final_role_ids(member: discord.Member, base_ids: set[int], to_add: set[int], to_remove: set[int]) -> set[int]:
+    """Apply add/remove to base_ids plus every derived-role rule a commit would apply."""
+    guild = member.guild
+    final_ids = set(base_ids)
+    final_ids |= {r_id for r_id in to_add if guild.get_role(r_id)}
+    final_ids -= to_remove
+
+    if not member.bot:
+        final_ids = _ensure_roles(final_ids, guild)
+        final_ids = _fix_categories(final_ids, guild)
+    else:
+        if guild.get_role(config.roles['bot']): final_ids.add(config.roles['bot'])
+        final_ids.discard(config.roles['person'])
+
+    return final_ids
+
+
+# ---------------------------------------------------------------------------
+# per-member commit coalescing
+# ---------------------------------------------------------------------------
+
+class _PendingEdit:
+    """add/remove sets merged from every session committed on one member within a window."""
+
+    def __init__(self):
+        self.to_add: set[int] = set()
+        self.to_remove: set[int] = set()
+        self.priority = role_scheduler.BULK
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def merge(self, to_add: set[int], to_remove: set[int], priority: int) -> None:
+        # later sessions win over earlier ones
+        self.to_add -= to_remove
+        self.to_remove -= to_add
+        self.to_add |= to_add
+        self.to_remove |= to_remove
+        # the most urgent session decides which lane the edit goes in
+        self.priority = min(self.priority, priority)
+
+    def yield_to(self, to_add: set[int], to_remove: set[int]) -> None:
+        # a newer session owns these roles now, don't touch them when this edit finally runs
+        self.to_add -= to_remove
+        self.to_remove -= to_add
+
+
+_pending_edits: dict[int, _PendingEdit] = {}
+# edits already handed to the scheduler, possibly sitting behind a slower lane - newer sessions
+# strip their roles from these so a stale bulk edit can't undo them when it gets its turn
+_queued_edits: dict[int, list[_PendingEdit]] = {}
+_flush_tasks: set[asyncio.Task] = set()
+_member_locks: dict[int, asyncio.Lock] = {}
+# member id -> (monotonic time, added ids, removed ids) of our last edits, used until the gateway
+# cache catches up - only our own delta, so changes anyone else made meanwhile survive
+_written_roles: dict[int, tuple[float, frozenset[int], frozenset[int]]] = {}
+
+
+def _base_role_ids(member: discord.Member) -> set[int]:
+    role_ids = {r.id for r in member.roles}
+    written = _written_roles.get(member.id)
+    if written is None:
+        return role_ids
+    written_at, added, removed = written
+    caught_up = added <= role_ids and not (removed & role_ids)
+    if caught_up or time.monotonic() - written_at > config.timings['role_commit_trust']:
+        # cache caught up (or it's been long enough that it must have)
+        del _written_roles[member.id]
+        return role_ids
+    return (role_ids | added) - removed
+
+
+def _planned_edit(guild: discord.Guild, member_id: int, pending: _PendingEdit) -> tuple[discord.Member, set[int]] | None:
+    fresh_member = guild.get_member(member_id)
+    if not fresh_member:
+        return None
+    base_ids = _base_role_ids(fresh_member)
+    final_ids = final_role_ids(fresh_member, base_ids, pending.to_add, pending.to_remove)
+    if final_ids == base_ids:
+        return None
+    return fresh_member, final_ids
+
+
+async def _write_member(guild: discord.Guild, member_id: int, pending: _PendingEdit) -> None:
+    async with _member_locks.setdefault(member_id, asyncio.Lock()):
+        # recompute: the member may have changed while the edit sat in the queue
+        planned = _planned_edit(guild, member_id, pending)
+        if not planned:
+            return
+        fresh_member, final_ids = planned
+        # back to Role objects only once, for the actual edit
+        final_roles = [role for role in map(guild.get_role, final_ids) if role]
+        await fresh_member.edit(roles=final_roles)
+        cached_ids = {r.id for r in fresh_member.roles}
+        _written_roles[member_id] = (
+            time.monotonic(), frozenset(final_ids - cached_ids), frozenset(cached_ids - final_ids)
+        )
+
+
+async def _flush_member(guild: discord.Guild, member_id: int) -> None:
+    await asyncio.sleep(config.timings['role_commit'])
+    pending = _pending_edits.pop(member_id)
+    queued = _queued_edits.setdefault(member_id, [])
+    queued.append(pending)
+
+    try:
+        if _planned_edit(guild, member_id, pending):
+            await role_scheduler.submit(
+                'member_edit', pending.priority, lambda: _write_member(guild, member_id, pending)
+            )
+    except Exception as e:
+        pending.done.set_exception(e)
+    else:
+        pending.done.set_result(None)
+    finally:
+        queued.remove(pending)
+        if not queued:
+            del _queued_edits[member_id]
+
+
 class RoleSession:
-    def __init__(self, member: discord.Member, autocommit: bool = True):
+    def __init__(self, member: discord.Member, autocommit: bool = True, priority: int = role_scheduler.INTERACTIVE):
         self.member = member
         self.guild = member.guild
         self.autocommit = autocommit
+        self.priority = priority
         self.to_add = set()
         self.to_remove = set()
 
@@ -121,33 +256,33 @@ class RoleSession:
                 self.to_add.discard(r_id)
 
     async def commit(self):
-        fresh_member = self.guild.get_member(self.member.id)
-        if not fresh_member:
-            return
-        final_roles = set(fresh_member.roles)
-        for r_id in self.to_add:
-            role = self.guild.get_role(r_id)
-            if role:
-                final_roles.add(role)
-        for r_id in self.to_remove:
-            role = self.guild.get_role(r_id)
-            if role:
-                final_roles.discard(role)
-
-        if not self.member.bot:
-            final_roles = _ensure_roles(final_roles, self.guild)
-            final_roles = _fix_categories(final_roles, self.guild)
-        else:
-            guild = self.member.guild
-            bot_role = guild.get_role(config.roles['bot'])
-            person_role = guild.get_role(config.roles['person'])
-            if bot_role: final_roles.add(bot_role)
-            if person_role: final_roles.discard(person_role)
-
-
-
-        if final_roles != set(fresh_member.roles):
-            await fresh_member.edit(roles=list(final_roles))
+        """Queue this session's changes behind any other pending ones on the same member.
+
+        Sessions committed within the role_commit window are merged and written as a single
+        edit, queued in the scheduler lane of the most urgent session; every committer waits
+        for (and sees errors from) that edit. Edits already queued for the member give up the
+        roles this session touches, so a slower lane can't undo it afterwards.
+        """
+        member_id = self.member.id
+        for queued in _queued_edits.get(member_id, ()):
+            queued.yield_to(self.to_add, self.to_remove)
+        pending = _pending_edits.get(member_id)
+
+        if pending is None:
+            fresh_member = self.guild.get_member(member_id)
+            if not fresh_member:
+                return
+            base_ids = _base_role_ids(fresh_member)
+            if final_role_ids(fresh_member, base_ids, self.to_add, self.to_remove) == base_ids:
+                return  # nothing to write, don't make the caller wait
+
+            pending = _pending_edits[member_id] = _PendingEdit()
+            task = asyncio.create_task(_flush_member(self.guild, member_id))
+            _flush_tasks.add(task)
+            task.add_done_callback(_flush_tasks.discard)
+
+        pending.merge(self.to_add, self.to_remove, self.priority)
+        await asyncio.shield(pending.done)
 
     async def __aenter__(self):
         return self
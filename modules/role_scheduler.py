@@ -0,0 +1,104 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+
+import discord
+from modules import config
+
+# priority lanes, lower runs first
+INTERACTIVE = 0  # reaction roles, wardrobe picks, commands - someone is waiting on it
+NORMAL = 1       # reactions to gateway events (on_member_update follow-ups etc.)
+BULK = 2         # background sweeps and reconciliation
+
+
+class _RouteBucket:
+    """Sliding-window limiter for one discord rate-limit route."""
+
+    def __init__(self, limit: int, per: float):
+        self.limit = limit
+        self.per = per
+        self.calls: deque[float] = deque()
+        self.paused_until = 0.0
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            while self.calls and now - self.calls[0] >= self.per:
+                self.calls.popleft()
+
+            wait = self.paused_until - now
+            if len(self.calls) >= self.limit:
+                wait = max(wait, self.calls[0] + self.per - now)
+            if wait <= 0:
+                self.calls.append(now)
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+_buckets: dict[str, _RouteBucket] = {}
+_queue: asyncio.PriorityQueue | None = None
+_seq = itertools.count()  # keeps FIFO order inside a lane
+_worker: asyncio.Task | None = None
+
+
+def _bucket(route: str) -> _RouteBucket:
+    bucket = _buckets.get(route)
+    if bucket is None:
+        limit, per = config.rate_limits[route]
+        bucket = _buckets[route] = _RouteBucket(limit, per)
+    return bucket
+
+
+async def _run() -> None:
+    while True:
+        priority, _, route, job, fut, retried = await _queue.get()
+        if fut.cancelled():
+            continue
+
+        bucket = _bucket(route)
+        await bucket.acquire()
+        try:
+            result = await job()
+        except discord.HTTPException as e:
+            if e.status == 429 and not retried:
+                # we misjudged the bucket - back off for a full window and try once more
+                bucket.pause(bucket.per)
+                _queue.put_nowait((priority, next(_seq), route, job, fut, True))
+            elif not fut.done():
+                fut.set_exception(e)
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+        else:
+            if not fut.done():
+                fut.set_result(result)
+
+
+async def submit(route: str, priority: int, job):
+    """Run job() once a slot on route is free, ahead of every job in a lower-priority lane."""
+    global _queue, _worker
+    if _queue is None:
+        _queue = asyncio.PriorityQueue()
+    if _worker is None or _worker.done():
+        _worker = asyncio.create_task(_run())
+
+    fut = asyncio.get_running_loop().create_future()
+    _queue.put_nowait((priority, next(_seq), route, job, fut, False))
+    return await fut
+
+
+async def shutdown() -> None:
+    """Stop the worker and drop anything still queued (benchmarks, clean loop teardown)."""
+    global _queue, _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+    _queue = None
+    _worker = None